@@ -0,0 +1,105 @@
+"""
+Time parsing, single pair propagation and full risk matrices on synthetic DSMs.
+
+    python benchmarks/run_benchmarks.py --sizes 25 50 100 --depths 2 3 4 --output results.json
+
+Results are written as JSON, so that runs can be compared.
+"""
+from argparse import ArgumentParser
+from statistics import mean
+from tempfile import TemporaryDirectory
+from time import perf_counter
+import json
+import os
+import platform
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cpm.generate import generate_dsm_pair
+from cpm.models import DSM, ChangePropagationTree
+from cpm.parse import parse_csv
+from cpm.utils import calculate_risk_matrix
+
+
+def write_csv(dsm: DSM, path: str, delimiter: str = ';'):
+    # Written in the orientation of the CSV input, with the names on the diagonal
+    matrix = dsm.matrix.T if dsm.instigator == 'row' else dsm.matrix
+    with open(path, 'w') as file:
+        file.write(delimiter.join([''] + dsm.columns) + '\n')
+        for i, name in enumerate(dsm.columns):
+            cells = ['' if value == 0 else repr(float(value)) for value in matrix[i].tolist()]
+            cells[i] = name
+            file.write(delimiter.join([name] + cells) + '\n')
+
+
+def measure(function, repeat: int) -> dict:
+    timings = []
+    for _ in range(repeat):
+        start = perf_counter()
+        function()
+        timings.append(perf_counter() - start)
+    return {'best': min(timings), 'mean': mean(timings), 'repeat': repeat}
+
+
+def single_pair(dsm_impact: DSM, dsm_likelihood: DSM, search_depth: int):
+    # The pair of the first and last sub-system, which may be in different modules
+    cpt = ChangePropagationTree(0, len(dsm_likelihood.columns) - 1, dsm_impact, dsm_likelihood)
+    cpt.propagate(search_depth=search_depth)
+    cpt.get_risk()
+
+
+def run(sizes: list[int], depths: list[int], density: float, modules: int, reciprocity: float,
+        repeat: int, seed: int) -> list[dict]:
+    results = []
+    with TemporaryDirectory() as directory:
+        for size in sizes:
+            dsm_impact, dsm_likelihood = generate_dsm_pair(size, density=density, modules=min(modules, size),
+                                                           reciprocity=reciprocity, seed=seed)
+            case = {'size': size, 'density': density, 'modules': min(modules, size), 'reciprocity': reciprocity,
+                    'interactions': int(len(dsm_likelihood.data))}
+
+            path = os.path.join(directory, f'dsm-{size}.csv')
+            write_csv(dsm_likelihood, path)
+            results.append({'benchmark': 'parse_csv', **case, **measure(lambda: parse_csv(path), repeat)})
+            print(results[-1])
+
+            for depth in depths:
+                results.append({'benchmark': 'single_pair', **case, 'search_depth': depth,
+                                **measure(lambda: single_pair(dsm_impact, dsm_likelihood, depth), repeat)})
+                print(results[-1])
+                results.append({'benchmark': 'calculate_risk_matrix', **case, 'search_depth': depth,
+                                **measure(lambda: calculate_risk_matrix(dsm_impact, dsm_likelihood, depth),
+                                          repeat)})
+                print(results[-1])
+
+    return results
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[25, 50, 100])
+    parser.add_argument('--depths', type=int, nargs='+', default=[2, 3, 4])
+    parser.add_argument('--density', type=float, default=0.1)
+    parser.add_argument('--modules', type=int, default=4)
+    parser.add_argument('--reciprocity', type=float, default=0.3)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='benchmark-results.json')
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.depths, args.density, args.modules, args.reciprocity, args.repeat, args.seed)
+    report = {
+        'environment': {'python': platform.python_version(), 'numpy': np.__version__,
+                        'platform': platform.platform(), 'processor': platform.processor()},
+        'parameters': vars(args),
+        'results': results,
+    }
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
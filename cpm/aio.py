@@ -0,0 +1,154 @@
+from concurrent.futures import Executor
+from typing import AsyncIterator, Optional, Union
+import asyncio
+import numpy as np
+from cpm.cache import result_key
+from cpm.models import DSM, validate_dsm_pair
+from cpm.instrumentation import active_stats
+from cpm.parallel import SharedDSMPair, propagate_chunk, record_calls, source_chunks
+
+
+class _SharedComputation:
+    """
+    Propagation from every source of a DSM pair, running in an executor. Completed rows are broadcast to
+    every subscriber. The computation is cancelled when its last subscriber leaves before it is done.
+    """
+
+    def __init__(self, key: tuple, dsm_impact: DSM, dsm_likelihood: DSM, search_depth: int,
+                 executor: Optional[Executor], chunk_size: Optional[int]):
+        self.key: tuple = key
+        # Risk and probability from each completed source to every target
+        self.rows: dict[int, np.ndarray] = {}
+        self.error: Optional[BaseException] = None
+        self.done: bool = False
+        self._subscribers: list[asyncio.Queue] = []
+        self._task: asyncio.Task = asyncio.ensure_future(
+            self._run(dsm_impact, dsm_likelihood, search_depth, executor, chunk_size))
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue()
+        for source in self.rows:
+            queue.put_nowait(source)
+        if self.done:
+            queue.put_nowait(None)
+        self._subscribers.append(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.remove(queue)
+        if not self._subscribers and not self.done:
+            self._task.cancel()
+            self._release()
+
+    def _release(self):
+        if _in_flight.get(self.key) is self:
+            del _in_flight[self.key]
+
+    async def _run(self, dsm_impact: DSM, dsm_likelihood: DSM, search_depth: int, executor: Optional[Executor],
+                   chunk_size: Optional[int]):
+        loop = asyncio.get_running_loop()
+        chunks = source_chunks(list(range(len(dsm_likelihood.columns))), chunk_size=chunk_size)
+
+        # Workers do not share the context of the computation, so they report their stats back to it
+        instrument = active_stats() is not None
+
+        try:
+            with SharedDSMPair(dsm_impact, dsm_likelihood) as shared:
+                futures = [loop.run_in_executor(executor, propagate_chunk, shared.spec, chunk, search_depth, False,
+                                                False, None, instrument)
+                           for chunk in chunks]
+                try:
+                    for completed in asyncio.as_completed(futures):
+                        result = await completed
+                        if instrument:
+                            record_calls(result[2])
+                        sources, blocks = result[0], result[1]
+                        for row, source in enumerate(sources):
+                            self.rows[source] = blocks[:, row]
+                            for queue in self._subscribers:
+                                queue.put_nowait(source)
+                finally:
+                    for future in futures:
+                        future.cancel()
+                    # Chunks that already started still use the shared DSMs
+                    await asyncio.wait(futures)
+        except asyncio.CancelledError:
+            raise
+        except BaseException as error:
+            self.error = error
+        finally:
+            self.done = True
+            self._release()
+
+        for queue in self._subscribers:
+            queue.put_nowait(None)
+
+
+# Running computations, by event loop and DSM pair
+_in_flight: dict[tuple, _SharedComputation] = {}
+
+
+async def iter_risk_rows(dsm_impact: DSM, dsm_likelihood: DSM, search_depth: int = 4,
+                         executor: Optional[Executor] = None, chunk_size: Optional[int] = None) \
+        -> AsyncIterator[tuple[int, np.ndarray, np.ndarray]]:
+    """
+    Propagate change from every sub-system in an executor, without blocking the event loop.
+    Rows are yielded as their chunk completes, in no particular order.
+
+    Concurrent iterations over the same DSM pair and search depth in one event loop share a single computation,
+    which runs in the executor of the first one. It is cancelled when every iteration has stopped early,
+    e.g. through `aclose()` or the cancellation of the consuming task.
+    :param dsm_impact: Impact DSM
+    :param dsm_likelihood: Likelihood DSM
+    :param search_depth: Maximum length of propagation paths
+    :param executor: A thread or process pool executor. Defaults to the default executor of the event loop.
+    :param chunk_size: Number of sources per task. Defaults to four tasks per CPU.
+    :return: Async iterator of an instigator index, and the risk and likelihood of propagation from it to every
+    sub-system. For column instigators these are the columns of `calculate_risk_matrix()`, and for row
+    instigators its rows.
+    """
+    validate_dsm_pair(dsm_impact, dsm_likelihood)
+
+    key = (asyncio.get_running_loop(), result_key(dsm_impact, dsm_likelihood, search_depth, kind='risk-rows'))
+    computation = _in_flight.get(key)
+    if computation is None:
+        computation = _in_flight[key] = _SharedComputation(key, dsm_impact, dsm_likelihood, search_depth,
+                                                           executor, chunk_size)
+
+    queue = computation.subscribe()
+    try:
+        while True:
+            source = await queue.get()
+            if source is None:
+                break
+            risk, prob = computation.rows[source]
+            yield source, risk, prob
+
+        if computation.error is not None:
+            raise computation.error
+    finally:
+        computation.unsubscribe(queue)
+
+
+async def calculate_risk_matrix_async(dsm_impact: DSM, dsm_likelihood: DSM, search_depth: int = 4,
+                                      executor: Optional[Executor] = None, chunk_size: Optional[int] = None) \
+        -> list[list[Union[float, str]]]:
+    """
+    Async variant of `calculate_risk_matrix()`, see `iter_risk_rows()`.
+    :param dsm_impact: Impact DSM
+    :param dsm_likelihood: Likelihood DSM
+    :param search_depth: Maximum length of propagation paths
+    :param executor: A thread or process pool executor. Defaults to the default executor of the event loop.
+    :param chunk_size: Number of sources per task
+    :return: Risk matrix, identical to the one of `calculate_risk_matrix()`
+    """
+    size = len(dsm_likelihood.columns)
+    # Rows are instigators, columns are targets
+    matrix = np.zeros((size, size))
+    async for source, risk, _ in iter_risk_rows(dsm_impact, dsm_likelihood, search_depth, executor, chunk_size):
+        matrix[source] = risk
+
+    if dsm_impact.instigator == 'column':
+        matrix = matrix.T
+
+    return matrix.tolist()
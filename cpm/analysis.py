@@ -0,0 +1,138 @@
+from typing import Optional
+import numpy as np
+from cpm.models import DSM, validate_dsm_pair
+from cpm.propagation import SourcePropagation
+from cpm.utils import calculate_cpm_matrices
+
+
+class ChangePropagationAnalysis:
+    """
+    Risk and likelihood matrices of a pair of DSMs, kept up to date as individual cells are changed.
+    After a change, only the (start, target) pairs with a path through the changed interaction within the
+    search depth are recalculated.
+
+    The DSMs are changed in place. Change cells through `set_likelihood()` and `set_impact()` rather than
+    through the DSMs or their node networks, so that the results stay consistent.
+    """
+
+    def __init__(self, dsm_impact: DSM, dsm_likelihood: DSM, search_depth: int = 4):
+        """
+        Calculate the initial risk and likelihood matrices.
+        :param dsm_impact: Impact DSM
+        :param dsm_likelihood: Likelihood DSM
+        :param search_depth: Maximum length of propagation paths
+        """
+        validate_dsm_pair(dsm_impact, dsm_likelihood)
+
+        self.dsm_impact: DSM = dsm_impact
+        self.dsm_likelihood: DSM = dsm_likelihood
+        self.search_depth: int = search_depth
+
+        matrices = calculate_cpm_matrices(dsm_impact, dsm_likelihood, search_depth=search_depth)
+        # Laid out like the result of `calculate_risk_matrix()`
+        self.risk: np.ndarray = np.array(matrices.risk)
+        self.likelihood: np.ndarray = np.array(matrices.likelihood)
+
+    def set_likelihood(self, row: int, column: int, value: Optional[float]) -> int:
+        """
+        Change a cell of the likelihood DSM and update the results.
+        :param row: Row of the cell, as in the DSM input
+        :param column: Column of the cell, as in the DSM input
+        :param value: New likelihood. None empties the cell.
+        :return: Number of recalculated (start, target) pairs
+        """
+        instigator, receiver = self._edge(row, column)
+        value = 0.0 if value is None else float(value)
+        if value != 0 and instigator != receiver and self.dsm_impact.matrix[receiver, instigator] == 0:
+            raise ValueError('Unexpected empty DSM cell. The impact of an interaction with a likelihood is null.')
+
+        previous = self.dsm_likelihood.matrix[receiver, instigator]
+        if instigator == receiver or previous == value:
+            self.dsm_likelihood.set_value(row, column, value)
+            return 0
+
+        if previous == 0:
+            # New interaction. The distances need to include it to find the paths through it.
+            self.dsm_likelihood.set_value(row, column, value)
+            affected = self._affected(instigator, receiver, final_only=False)
+        else:
+            # Changed or removed interaction. The paths through it are found using the distances before the change.
+            affected = self._affected(instigator, receiver, final_only=False)
+            self.dsm_likelihood.set_value(row, column, value)
+
+        return self._recalculate(affected)
+
+    def set_impact(self, row: int, column: int, value: Optional[float]) -> int:
+        """
+        Change a cell of the impact DSM and update the results.
+        :param row: Row of the cell, as in the DSM input
+        :param column: Column of the cell, as in the DSM input
+        :param value: New impact. None empties the cell.
+        :return: Number of recalculated (start, target) pairs
+        """
+        instigator, receiver = self._edge(row, column)
+        value = 0.0 if value is None else float(value)
+        has_likelihood = self.dsm_likelihood.matrix[receiver, instigator] != 0
+        if value == 0 and instigator != receiver and has_likelihood:
+            raise ValueError('Unexpected empty DSM cell. The impact of an interaction with a likelihood is null.')
+
+        previous = self.dsm_impact.matrix[receiver, instigator]
+        self.dsm_impact.set_value(row, column, value)
+        if instigator == receiver or previous == value or not has_likelihood:
+            return 0
+
+        # Impact only matters for the final interaction of a path
+        affected = self._affected(instigator, receiver, final_only=True)
+
+        return self._recalculate(affected)
+
+    def _edge(self, row: int, column: int) -> tuple[int, int]:
+        size = len(self.dsm_likelihood.columns)
+        if not (0 <= row < size and 0 <= column < size):
+            raise ValueError('Cell is outside of the DSM.')
+
+        # Instigator and receiver of the interaction
+        if self.dsm_likelihood.instigator == 'row':
+            return row, column
+        return column, row
+
+    def _affected(self, instigator: int, receiver: int, final_only: bool) -> list[tuple[int, np.ndarray]]:
+        """
+        Find the pairs that may have a path through an interaction within the search depth.
+        :param final_only: Only consider paths where the interaction is the final one
+        :return: Pairs of a source and its targets
+        """
+        # A path source -> ... -> instigator -> receiver -> ... -> target
+        to_instigator = self.dsm_likelihood.distances_to(instigator, self.search_depth)
+        from_receiver = self.dsm_likelihood.distances_from(receiver, self.search_depth)
+        sources = np.flatnonzero(to_instigator + 1 <= self.search_depth)
+
+        targets = []
+        for source in sources.tolist():
+            if final_only:
+                source_targets = np.array([receiver])
+            else:
+                remaining = self.search_depth - 1 - to_instigator[source]
+                source_targets = np.flatnonzero(from_receiver <= remaining)
+            targets.append(source_targets[source_targets != source])
+
+        return list(zip(sources.tolist(), targets))
+
+    def _recalculate(self, affected: list[tuple[int, np.ndarray]]) -> int:
+        propagation = SourcePropagation(self.dsm_impact, self.dsm_likelihood, search_depth=self.search_depth)
+
+        count = 0
+        for source, targets in affected:
+            if len(targets) == 0:
+                continue
+
+            risk, prob = propagation.propagate(source, targets=targets)
+            if self.dsm_likelihood.instigator == 'column':
+                self.risk[targets, source] = risk[targets]
+                self.likelihood[targets, source] = prob[targets]
+            else:
+                self.risk[source, targets] = risk[targets]
+                self.likelihood[source, targets] = prob[targets]
+            count += len(targets)
+
+        return count
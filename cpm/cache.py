@@ -0,0 +1,152 @@
+from typing import Optional
+import hashlib
+import json
+import os
+import tempfile
+import numpy as np
+from cpm.memo import PropagationCache
+from cpm.models import DSM
+from cpm.storage import load_matrix, save_matrix
+
+# Part of every cache key. Increase when a change to the propagation engines alters results.
+ENGINE_VERSION = 1
+
+_SUFFIX = '.cpm'
+
+
+def result_key(dsm_impact: DSM, dsm_likelihood: DSM, search_depth: int, kind: str = 'risk') -> str:
+    """
+    Content hash identifying the result of an analysis.
+    :param dsm_impact: Impact DSM
+    :param dsm_likelihood: Likelihood DSM
+    :param search_depth: Maximum length of propagation paths
+    :param kind: Type of result
+    :return: Hexadecimal SHA-256 digest of the DSM values, headers and instigators, the search depth,
+    the type of result and the engine version
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps({
+        'engine': ENGINE_VERSION,
+        'kind': kind,
+        'search_depth': search_depth,
+    }, sort_keys=True).encode('utf-8'))
+
+    for dsm in [dsm_impact, dsm_likelihood]:
+        matrix = np.ascontiguousarray(dsm.matrix, dtype='<f8')
+        digest.update(json.dumps({
+            'columns': list(dsm.columns),
+            'instigator': dsm.instigator,
+            'shape': list(matrix.shape),
+        }).encode('utf-8'))
+        digest.update(matrix.tobytes())
+
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    Cache of result matrices on local disk, with a tier of recently used results in memory.
+    Entries are keyed by `result_key()`, so any change to the DSMs leads to a new entry.
+    Once the files exceed `max_bytes`, the least recently used ones are removed.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 256 * 1024 * 1024, memory_entries: int = 8):
+        """
+        :param directory: Directory of the cache files. It is created if it does not exist.
+        :param max_bytes: Maximum total size of the cache files
+        :param memory_entries: Maximum number of results kept in memory
+        """
+        if max_bytes < 1:
+            raise ValueError('max_bytes needs to be a positive number.')
+
+        self.directory: str = directory
+        self.max_bytes: int = max_bytes
+        self.memory: PropagationCache = PropagationCache(memory_entries)
+        self.hits: int = 0
+        self.misses: int = 0
+
+        os.makedirs(directory, exist_ok=True)
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """
+        Look up a result.
+        :param key: Key from `result_key()`
+        :return: The cached matrix, or None
+        """
+        matrix = self.memory.get(key)
+        if matrix is not None:
+            self.hits += 1
+            return matrix
+
+        path = self._path(key)
+        try:
+            matrix, _ = load_matrix(path, mmap=False)
+            # Mark the file as recently used
+            os.utime(path)
+        except (FileNotFoundError, ValueError):
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.memory.put(key, matrix)
+
+        return matrix
+
+    def put(self, key: str, matrix: np.ndarray, metadata: Optional[dict] = None):
+        """
+        Store a result.
+        :param key: Key from `result_key()`
+        :param matrix: Result matrix
+        :param metadata: JSON serializable metadata stored with the matrix
+        """
+        matrix = np.array(matrix, dtype=np.float64)
+        matrix.flags.writeable = False
+        self.memory.put(key, matrix)
+
+        # Write to a temporary file first, so concurrent readers never see a partial file
+        handle, temporary = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        os.close(handle)
+        try:
+            save_matrix(temporary, matrix, kind='result', metadata=metadata)
+            os.replace(temporary, self._path(key))
+        except BaseException:
+            os.remove(temporary)
+            raise
+
+        self._evict()
+
+    def clear(self):
+        """
+        Remove all cached results, from memory and from disk.
+        """
+        self.memory.clear()
+        for name in os.listdir(self.directory):
+            if name.endswith(_SUFFIX):
+                os.remove(os.path.join(self.directory, name))
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + _SUFFIX)
+
+    def _evict(self):
+        files = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(_SUFFIX):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, name))
+
+        total = sum(size for _, size, _ in files)
+        for _, size, name in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def __str__(self):
+        return f'{self.hits} hits, {self.misses} misses, {len(self.memory)} results in memory'
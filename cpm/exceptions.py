@@ -1,3 +1,10 @@
 class AutoDelimiterError(Exception):
     def __init__(self, message):
         super().__init__(message)
+
+
+class CSVParseError(ValueError):
+    def __init__(self, message, row=None, column=None):
+        super().__init__(message)
+        self.row = row
+        self.column = column
@@ -0,0 +1,78 @@
+from typing import Optional, Sequence
+import numpy as np
+from cpm.models import DSM
+
+
+def generate_dsm_pair(size: int, density: float = 0.1, modules: int = 1, modularity: float = 0.9,
+                      reciprocity: float = 0.0, distribution: str = 'uniform',
+                      parameters: Optional[Sequence[float]] = None, seed=None,
+                      instigator: str = 'column') -> tuple[DSM, DSM]:
+    """
+    Generate a random impact and likelihood DSM pair, for benchmarks and tests.
+    Both DSMs have the same interactions, so every likelihood has an impact.
+    :param size: Number of sub-systems
+    :param density: Expected share of the off-diagonal cells that hold an interaction
+    :param modules: Number of modules the sub-systems are evenly divided into
+    :param modularity: Expected share of the interactions that are within a module. Ignored for a single module.
+    :param reciprocity: Probability that a pair of interacting sub-systems interacts in both directions
+    :param distribution: Distribution of the values: **uniform** between two values, **beta** with two shape
+    parameters, or **levels** picked evenly from a set of values
+    :param parameters: Parameters of the distribution. Defaults to (0.1, 0.9) for uniform,
+    (2, 5) for beta and (0.1, 0.3, 0.5, 0.7, 0.9) for levels.
+    :param seed: Seed for `numpy.random.default_rng`
+    :param instigator: Instigator of the generated DSMs
+    :return: Impact DSM and likelihood DSM
+    """
+    if size < 1:
+        raise ValueError('size needs to be a positive number.')
+    if not 1 <= modules <= size:
+        raise ValueError('modules needs to be between 1 and size.')
+    for name, value in [('density', density), ('modularity', modularity), ('reciprocity', reciprocity)]:
+        if not 0 <= value <= 1:
+            raise ValueError(f'{name} needs to be between 0 and 1.')
+    if distribution not in ['uniform', 'beta', 'levels']:
+        raise ValueError('distribution argument needs to be either "uniform", "beta" or "levels".')
+
+    rng = np.random.default_rng(seed)
+
+    # Probability of an interaction in each cell, given the module structure
+    module = np.arange(size) * modules // size
+    same_module = module[:, np.newaxis] == module[np.newaxis, :]
+    np.fill_diagonal(same_module, False)
+    expected = density * size * (size - 1)
+    if modules == 1 or same_module.all():
+        probability = np.full((size, size), density)
+    else:
+        inner_cells = same_module.sum()
+        outer_cells = size * (size - 1) - inner_cells
+        inner = min(1.0, modularity * expected / inner_cells) if inner_cells else 0.0
+        outer = min(1.0, (1 - modularity) * expected / outer_cells)
+        probability = np.where(same_module, inner, outer)
+
+    # Decide per pair of sub-systems. A linked pair interacts both ways with the reciprocity as probability,
+    # and one way otherwise. This keeps the expected number of interactions per cell at the cell probability.
+    linked = rng.random((size, size)) < np.minimum(1.0, 2 * probability / (1 + reciprocity))
+    both_ways = rng.random((size, size)) < reciprocity
+    forward = rng.random((size, size)) < 0.5
+    upper = np.triu(np.ones((size, size), dtype=bool), k=1)
+    linked &= upper
+    mask = linked & (both_ways | forward)
+    mask |= (linked & (both_ways | ~forward)).T
+
+    impacts = np.where(mask, _draw(rng, (size, size), distribution, parameters), 0.0)
+    likelihoods = np.where(mask, _draw(rng, (size, size), distribution, parameters), 0.0)
+
+    columns = [f'S{index}' for index in range(size)]
+    return (DSM(impacts, list(columns), instigator=instigator),
+            DSM(likelihoods, list(columns), instigator=instigator))
+
+
+def _draw(rng: np.random.Generator, shape: tuple[int, int], distribution: str,
+          parameters: Optional[Sequence[float]]) -> np.ndarray:
+    if distribution == 'uniform':
+        low, high = parameters or (0.1, 0.9)
+        return rng.uniform(low, high, shape)
+    if distribution == 'beta':
+        a, b = parameters or (2, 5)
+        return rng.beta(a, b, shape)
+    return rng.choice(np.asarray(parameters or (0.1, 0.3, 0.5, 0.7, 0.9), dtype=float), shape)
@@ -0,0 +1,116 @@
+from contextvars import ContextVar
+from threading import Lock
+from typing import Callable, Optional
+import heapq
+
+_active: ContextVar[Optional['PropagationStats']] = ContextVar('cpm_propagation_stats', default=None)
+
+COUNTERS = ['leaves', 'cycle_pruned', 'depth_pruned', 'target_paths']
+
+
+class PropagationStats:
+    """
+    Opt-in instrumentation of `ChangePropagationTree.propagate()`, `get_risk()`, `get_probability()`,
+    `parse_csv()`, `MemoizedPropagation.evaluate()`, and of the propagation from every source by
+    `SourcePropagation`, which runs whole-matrix calculations such as `calculate_risk_matrix()`.
+    Calls made while the stats are active are counted and timed:
+
+        with PropagationStats() as stats:
+            cpt.propagate(search_depth=4)
+        print(stats)
+
+    The stats are active in the current context, which includes threads started with a copy of it. Sources that
+    are propagated by workers of `cpm.parallel` are recorded in the worker and reported back to the stats.
+    Nothing is recorded when no stats are active.
+
+    Counters:
+    **leaves** allocated in propagation trees,
+    **cycle_pruned** branches that would have revisited a sub-system on their path,
+    **depth_pruned** branches that could not reach the target within the search depth,
+    **target_paths** paths that reach the target, and
+    **max_frontier**, the largest number of leaves on one level of a tree (the longest path for the depth-first
+    strategy).
+    """
+
+    def __init__(self, callback: Optional[Callable[[dict], None]] = None, slowest: int = 10):
+        """
+        :param callback: Called with a dict describing every recorded call, e.g. to forward it to a metrics system.
+        The dict holds the **phase**, its duration in **seconds**, and the **source** and **target** names and
+        counters of a propagation.
+        :param slowest: Number of slowest propagations to keep
+        """
+        self.callback: Optional[Callable[[dict], None]] = callback
+        self.counters: dict[str, int] = {name: 0 for name in COUNTERS}
+        self.counters['max_frontier'] = 0
+        # Total wall time and number of calls per phase
+        self.phase_seconds: dict[str, float] = {}
+        self.phase_calls: dict[str, int] = {}
+        self._slowest: int = slowest
+        # Slowest propagations as (seconds, sequence number, source, target), the fastest first
+        self._pairs: list[tuple[float, int, str, Optional[str]]] = []
+        self._recorded: int = 0
+        self._lock: Lock = Lock()
+        self._tokens: list = []
+
+    def __enter__(self) -> 'PropagationStats':
+        self._tokens.append(_active.set(self))
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        _active.reset(self._tokens.pop())
+
+    @property
+    def slowest_pairs(self) -> list[tuple[float, str, Optional[str]]]:
+        """
+        Slowest propagations, slowest first.
+        :return: (seconds, source, target) tuples, where change propagates from source to target. The target is
+        None for the propagation from a source to every sub-system.
+        """
+        return [(seconds, source, target) for seconds, _, source, target in sorted(self._pairs, reverse=True)]
+
+    def record(self, phase: str, seconds: float, source: Optional[str] = None, target: Optional[str] = None,
+               **counters: int):
+        """
+        Record a timed call.
+        :param phase: Name of the call
+        :param seconds: Wall time of the call
+        :param source: Name of the propagation source, if any
+        :param target: Name of the propagation target, if any
+        :param counters: Counters to add. **max_frontier** is kept as a maximum.
+        """
+        with self._lock:
+            self.phase_seconds[phase] = self.phase_seconds.get(phase, 0.0) + seconds
+            self.phase_calls[phase] = self.phase_calls.get(phase, 0) + 1
+
+            for name, value in counters.items():
+                if name == 'max_frontier':
+                    self.counters[name] = max(self.counters[name], value)
+                else:
+                    self.counters[name] = self.counters.get(name, 0) + value
+
+            if source is not None and self._slowest > 0:
+                self._recorded += 1
+                entry = (seconds, self._recorded, source, target)
+                if len(self._pairs) < self._slowest:
+                    heapq.heappush(self._pairs, entry)
+                else:
+                    heapq.heappushpop(self._pairs, entry)
+
+        if self.callback is not None:
+            self.callback({'phase': phase, 'seconds': seconds, 'source': source, 'target': target, **counters})
+
+    def __str__(self):
+        lines = [f'{name}: {value}' for name, value in self.counters.items()]
+        for phase, seconds in self.phase_seconds.items():
+            lines.append(f'{phase}: {self.phase_calls[phase]} calls, {seconds:.4f} s')
+        for seconds, source, target in self.slowest_pairs:
+            lines.append(f'{source} -> {target if target is not None else "*"}: {seconds:.4f} s')
+        return '\n'.join(lines)
+
+
+def active_stats() -> Optional[PropagationStats]:
+    """
+    Get the stats that are active in the current context.
+    :return: Stats, or None when instrumentation is disabled
+    """
+    return _active.get()
@@ -0,0 +1,136 @@
+from concurrent.futures import Executor
+from time import perf_counter
+from typing import Callable, Optional
+import os
+import tempfile
+import numpy as np
+from cpm.cache import result_key
+from cpm.models import DSM, validate_dsm_pair
+from cpm.parallel import iter_source_chunks
+from cpm.propagation import SourcePropagation
+from cpm.storage import load_matrix, save_matrix
+
+
+class RiskMatrixJob:
+    """
+    Risk and likelihood matrices of a job that may have stopped before every instigator was propagated.
+    Matrices are laid out like the result of `calculate_risk_matrix()`.
+    """
+
+    def __init__(self, risk: np.ndarray, likelihood: np.ndarray, completed: np.ndarray):
+        """
+        :param risk: Combined risk. Cells that are not completed are 0.
+        :param likelihood: Combined likelihood. Cells that are not completed are 0.
+        :param completed: True for the cells that were calculated
+        """
+        self.risk: np.ndarray = risk
+        self.likelihood: np.ndarray = likelihood
+        self.completed: np.ndarray = completed
+
+    @property
+    def complete(self) -> bool:
+        return bool(self.completed.all())
+
+
+def run_risk_matrix_job(dsm_impact: DSM, dsm_likelihood: DSM, search_depth: int = 4,
+                        progress: Optional[Callable[[int, int, int], None]] = None,
+                        time_budget: Optional[float] = None, checkpoint: Optional[str] = None,
+                        checkpoint_interval: float = 60.0, workers: Optional[int] = None,
+                        executor: Optional[Executor] = None) -> RiskMatrixJob:
+    """
+    Calculate the risk and likelihood matrices one instigator at a time, with progress reporting, an optional
+    time budget, and resumable checkpoints.
+
+    With `checkpoint`, the completed instigators are saved to the file every `checkpoint_interval` seconds, and
+    when the job stops, including through an exception. A job started with an existing checkpoint only
+    propagates the instigators that are missing from it. The checkpoint holds a fingerprint of the DSMs and the
+    search depth, and a checkpoint of another job raises a ValueError.
+    :param dsm_impact: Impact DSM
+    :param dsm_likelihood: Likelihood DSM
+    :param search_depth: Maximum length of propagation paths
+    :param progress: Called with the number of completed instigators, the total number of instigators and the
+    index of the instigator that was completed
+    :param time_budget: Wall time in seconds after which no further instigators are propagated. It is checked
+    between instigators, or between chunks when running in parallel.
+    :param checkpoint: File to save completed instigators to, and to resume from
+    :param checkpoint_interval: Minimum number of seconds between checkpoints
+    :param workers: Number of worker processes. By default, the matrices are calculated in the current process.
+    :param executor: Executor used to run chunks of sources in parallel, see `calculate_risk_matrix()`
+    :return: Matrices with a mask of the completed cells
+    """
+    validate_dsm_pair(dsm_impact, dsm_likelihood)
+
+    size = len(dsm_likelihood.columns)
+    fingerprint = result_key(dsm_impact, dsm_likelihood, search_depth, kind='checkpoint')
+
+    # Rows are instigators, columns are targets
+    matrices = np.zeros((2, size, size))
+    done = np.zeros(size, dtype=bool)
+    if checkpoint is not None and os.path.exists(checkpoint):
+        stored, header = load_matrix(checkpoint, mmap=False)
+        metadata = header['metadata']
+        if header['kind'] != 'checkpoint' or metadata.get('fingerprint') != fingerprint:
+            raise ValueError('The checkpoint was saved for other DSMs or another search depth.')
+        matrices[:] = stored.reshape(2, size, size)
+        done[metadata['completed']] = True
+
+    began = perf_counter()
+    saved = began
+    changed = False
+
+    def save():
+        # Write to a temporary file first, so an interrupted save never corrupts the checkpoint
+        directory = os.path.dirname(os.path.abspath(checkpoint))
+        handle, temporary = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        os.close(handle)
+        try:
+            save_matrix(temporary, matrices.reshape(2 * size, size), columns=dsm_likelihood.columns,
+                        kind='checkpoint', metadata={'fingerprint': fingerprint, 'search_depth': search_depth,
+                                                     'completed': np.flatnonzero(done).tolist()})
+            os.replace(temporary, checkpoint)
+        except BaseException:
+            os.remove(temporary)
+            raise
+
+    def complete(source: int, values: np.ndarray):
+        nonlocal saved, changed
+        matrices[:, source] = values
+        done[source] = True
+        changed = True
+        if progress is not None:
+            progress(int(done.sum()), size, source)
+        if checkpoint is not None and perf_counter() - saved >= checkpoint_interval:
+            save()
+            saved = perf_counter()
+            changed = False
+
+    def out_of_time() -> bool:
+        return time_budget is not None and perf_counter() - began >= time_budget
+
+    remaining = np.flatnonzero(~done).tolist()
+    parallel = (workers is not None and workers > 1) or executor is not None
+    try:
+        if remaining and parallel:
+            chunks = iter_source_chunks(dsm_impact, dsm_likelihood, search_depth=search_depth, workers=workers,
+                                        executor=executor, sources=remaining)
+            for sources, blocks in chunks:
+                for row, source in enumerate(sources):
+                    complete(source, blocks[:, row])
+                if out_of_time():
+                    # Stops the pool and cancels the chunks that have not started
+                    chunks.close()
+                    break
+        elif remaining:
+            propagation = SourcePropagation(dsm_impact, dsm_likelihood, search_depth=search_depth)
+            for source in remaining:
+                if out_of_time():
+                    break
+                complete(source, propagation.propagate(source))
+    finally:
+        if checkpoint is not None and changed:
+            save()
+
+    completed = np.repeat(done[:, np.newaxis], size, axis=1)
+    if dsm_impact.instigator == 'column':
+        return RiskMatrixJob(matrices[0].T, matrices[1].T, completed.T)
+    return RiskMatrixJob(matrices[0], matrices[1], completed)
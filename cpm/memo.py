@@ -0,0 +1,257 @@
+from collections import OrderedDict
+from time import perf_counter
+from typing import Hashable, Optional
+import numpy as np
+from cpm.instrumentation import COUNTERS, active_stats
+from cpm.models import DSM, validate_dsm_pair
+
+# Rough size of one cache entry, excluding the visited bitmask
+_ENTRY_OVERHEAD_BYTES = 320
+
+# Sub-trees that do not reach the target are cached as None, so a miss needs its own marker
+_MISSING = object()
+
+
+class PropagationCache:
+    """
+    Cache of evaluated sub-trees with hit/miss statistics.
+    When `max_entries` is set, the least recently used entries are evicted once the cache is full.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None):
+        """
+        :param max_entries: Maximum number of cached sub-trees. Unbounded by default.
+        """
+        if max_entries is not None and max_entries < 1:
+            raise ValueError('max_entries needs to be a positive number.')
+
+        self.max_entries: Optional[int] = max_entries
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+        self._entries: dict = OrderedDict() if max_entries is not None else {}
+
+    def get(self, key: Hashable, default=None):
+        """
+        Look up an entry, and count the lookup as a hit or a miss.
+        :param key: Key of the entry
+        :param default: Returned if there is no entry for the key
+        :return: The cached value, or `default`
+        """
+        try:
+            value = self._entries[key]
+        except KeyError:
+            self.misses += 1
+            return default
+
+        self.hits += 1
+        if self.max_entries is not None:
+            self._entries.move_to_end(key)
+
+        return value
+
+    def put(self, key: Hashable, value):
+        self._entries[key] = value
+
+        if self.max_entries is not None and len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __str__(self):
+        return f'{len(self)} entries, {self.hits} hits, {self.misses} misses, {self.evictions} evictions'
+
+
+class MemoizedPropagation:
+    """
+    Exact change propagation that caches the evaluation of sub-trees.
+    The sub-tree below a node only depends on the node, the remaining search depth, the target, and which of
+    the nodes that could still be visited on the way to the target are already on the path. Different path
+    prefixes that arrive in the same state share one evaluation.
+
+    Results are identical to those of `ChangePropagationTree`. When either DSM is changed with `DSM.set_value()`,
+    the cache is cleared and the interactions are read again on the next evaluation.
+    """
+
+    def __init__(self, dsm_impact: DSM, dsm_likelihood: DSM, max_entries: Optional[int] = None,
+                 max_memory: Optional[int] = None):
+        """
+        :param dsm_impact: Impact DSM
+        :param dsm_likelihood: Likelihood DSM
+        :param max_entries: Maximum number of cached sub-trees
+        :param max_memory: Approximate memory cap of the cache in bytes. Used if `max_entries` is not given.
+        """
+        validate_dsm_pair(dsm_impact, dsm_likelihood)
+
+        self.dsm_impact: DSM = dsm_impact
+        self.dsm_likelihood: DSM = dsm_likelihood
+        self.size: int = len(dsm_likelihood.columns)
+
+        if max_entries is None and max_memory is not None:
+            max_entries = max(1, max_memory // (_ENTRY_OVERHEAD_BYTES + self.size // 8))
+
+        self.cache: PropagationCache = PropagationCache(max_entries)
+
+        self._branches: list[list[tuple[int, float]]] = []
+        # Edit counters of the DSMs the branches and the cache were built from
+        self._edits: tuple[int, int] = (-1, -1)
+        self._target: int = -1
+        self._distances: Optional[np.ndarray] = None
+        self._distance_to_target: list[int] = []
+        self._relevant: dict[tuple[int, int], int] = {}
+        self._load_branches()
+        # Leaves, cycle pruned, depth pruned and target paths of the evaluated sub-trees, see `cpm.instrumentation`
+        self._counts: list[int] = [0, 0, 0, 0]
+
+    def _load_branches(self):
+        """
+        Read the interactions of the likelihood DSM, and forget everything evaluated before.
+        """
+        indptr = self.dsm_likelihood.indptr.tolist()
+        indices = self.dsm_likelihood.indices.tolist()
+        data = self.dsm_likelihood.data.tolist()
+        self._branches = [list(zip(indices[indptr[i]:indptr[i + 1]], data[indptr[i]:indptr[i + 1]]))
+                          for i in range(self.size)]
+
+        self._edits = (self.dsm_impact.edits, self.dsm_likelihood.edits)
+        self._target = -1
+        self.cache.clear()
+
+    def evaluate(self, start_index: int, target_index: int, search_depth: int = 4) -> tuple[float, float]:
+        """
+        Calculate the risk and probability of a change propagating from one sub-system to another.
+        Indices follow the conventions of `ChangePropagationTree`.
+        :param start_index: Column index for start of propagation
+        :param target_index: Column index for propagation target
+        :param search_depth: Maximum length of propagation paths
+        :return: Risk and probability
+        """
+        if self.dsm_impact.instigator == 'row':
+            start_index, target_index = target_index, start_index
+
+        stats = active_stats()
+        if stats is None:
+            return self._evaluate(start_index, target_index, search_depth)
+
+        began = perf_counter()
+        self._counts = [1, 0, 0, 0]
+        values = self._evaluate(start_index, target_index, search_depth)
+        columns = self.dsm_likelihood.columns
+        stats.record('evaluate', perf_counter() - began, source=columns[start_index], target=columns[target_index],
+                     **dict(zip(COUNTERS, self._counts)))
+
+        return values
+
+    def _evaluate(self, start_index: int, target_index: int, search_depth: int) -> tuple[float, float]:
+        if self._edits != (self.dsm_impact.edits, self.dsm_likelihood.edits):
+            self._load_branches()
+
+        self._set_target(target_index, search_depth)
+
+        if start_index == target_index or self._distance_to_target[start_index] > search_depth:
+            # These nodes are not connected.
+            return 0, 0
+
+        result = self._descend(start_index, 1 << start_index, search_depth)
+        if result is None:
+            return 0, 0
+
+        return result[0], result[1]
+
+    def get_risk(self, start_index: int, target_index: int, search_depth: int = 4) -> float:
+        """
+        Get risk of propagation
+        """
+        return self.evaluate(start_index, target_index, search_depth)[0]
+
+    def get_probability(self, start_index: int, target_index: int, search_depth: int = 4) -> float:
+        """
+        Get probability/likelihood of propagation
+        """
+        return self.evaluate(start_index, target_index, search_depth)[1]
+
+    def _set_target(self, target_index: int, search_depth: int):
+        distances = self.dsm_likelihood.distances_to(target_index, search_depth)
+        if target_index == self._target and distances is self._distances:
+            return
+
+        self._target = target_index
+        self._distances = distances
+        self._distance_to_target = distances.tolist()
+        self._relevant = {}
+
+    def _relevant_mask(self, node: int, remaining: int) -> int:
+        """
+        Bitmask of the nodes that can appear on a path from the node to the target within the remaining depth.
+        Only these nodes of the visited set affect the evaluation of the sub-tree.
+        """
+        key = (node, remaining)
+        mask = self._relevant.get(key)
+        if mask is None:
+            relevant = self.dsm_likelihood.distances_from(node, remaining) + self._distances <= remaining
+            mask = int.from_bytes(np.packbits(relevant, bitorder='little').tobytes(), 'little')
+            self._relevant[key] = mask
+
+        return mask
+
+    def _descend(self, node: int, visited: int, remaining: int) -> Optional[tuple[float, float, int]]:
+        target = self._target
+        key = (target, node, remaining, visited & self._relevant_mask(node, remaining))
+        cached = self.cache.get(key, _MISSING)
+        if cached is not _MISSING:
+            return cached
+
+        distance_to_target = self._distance_to_target
+        counts = self._counts
+        branches = []
+
+        for neighbour, likelihood in self._branches[node]:
+            if visited >> neighbour & 1:
+                counts[1] += 1
+                continue
+            if 1 + distance_to_target[neighbour] > remaining:
+                counts[2] += 1
+                continue
+
+            counts[0] += 1
+            if neighbour == target:
+                counts[3] += 1
+                impact = self.dsm_impact.matrix[target, node]
+                if impact == 0:
+                    raise ValueError('Unexpected empty DSM cell. The final impact cell was null. '
+                                     'Check if DSMs are valid.')
+                risk, prob, depth = float(impact), 1, 0
+            else:
+                branch = self._descend(neighbour, visited | 1 << neighbour, remaining - 1)
+                if branch is None:
+                    continue
+                risk, prob, depth = branch
+
+            branches.append((depth + 1, 1 - likelihood * risk, 1 - likelihood * prob))
+
+        result = None
+        if branches:
+            # Same order as the breadth-first tree: branches that reach the target sooner come first
+            branches.sort(key=lambda branch: branch[0])
+
+            risk_remainder = 1
+            prob_remainder = 1
+            for _, risk_factor, prob_factor in branches:
+                risk_remainder = risk_remainder * risk_factor
+                prob_remainder = prob_remainder * prob_factor
+
+            result = (1 - risk_remainder, 1 - prob_remainder, branches[0][0])
+
+        self.cache.put(key, result)
+
+        return result
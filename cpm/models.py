@@ -1,5 +1,9 @@
-from typing import Optional
-import numbers
+from bisect import bisect_right
+from collections import Counter
+from time import perf_counter
+from typing import Optional, Union
+import numpy as np
+from cpm.instrumentation import active_stats
 
 
 class DSM:
@@ -7,89 +11,312 @@ class DSM:
     Design Structure Matrix Class contains possible interactions between sub-systems.
     Typically, when performing Change Propagation analysis, there are two DSMs:
     one DSM for the likelihood of propagation, and one DSM for the impact of propagation.
+
+    The matrix is stored as a dense float64 array. Interactions are additionally indexed in
+    compressed sparse row (CSR) form: the neighbours of instigator ``j`` are
+    ``indices[indptr[j]:indptr[j + 1]]`` with the values ``data[indptr[j]:indptr[j + 1]]``.
     """
 
-    def __init__(self, matrix: list[list[Optional[float]]], columns: list[str], instigator='column'):
+    def __init__(self, matrix: Union[list[list[Optional[float]]], np.ndarray], columns: list[str],
+                 instigator='column'):
         """
         Construct a DSM using a matrix and column-header
-        :param matrix: List matrix containing floats or empty cells
+        :param matrix: List matrix or array containing floats or empty cells
         :param columns: Matrix header
         :param instigator: Can either be **column** or **row**. Determines directionality of interactions in DSM.
         By default, propagation travels from column to row
         """
-        self.matrix = DSM.clean_matrix(matrix)
-        self.columns = columns
-        self.node_network: dict[int, 'GraphNode'] = self.build_node_network(instigator)
-        self.instigator = instigator
-
         if instigator not in ['row', 'column']:
             raise ValueError('instigator argument needs to be either "row" or "column".')
 
+        self.matrix: np.ndarray = DSM.clean_matrix(matrix)
+        self.columns = columns
+        self.instigator = instigator
+
         self.validate_matrix()
 
+        if instigator == 'row':
+            # Transposed view. Calculation is always performed as if columns are the instigators.
+            self.matrix = self.matrix.T
+
+        self.indptr, self.indices, self.data = self.build_adjacency()
+        self._node_network: Optional[dict[int, 'GraphNode']] = None
+        self._reverse: Optional[tuple[np.ndarray, np.ndarray]] = None
+        # Search depth and hop distances to each target, see `distances_to()`
+        self._distances: dict[int, tuple[int, np.ndarray]] = {}
+        # Number of changed cells, see `set_value()`
+        self.edits: int = 0
+
     @staticmethod
-    def clean_matrix(matrix) -> list[list[float]]:
-        cleaned_matrix = []
-        for i, row in enumerate(matrix):
-            cleaned_matrix.append([])
-            for j, val in enumerate(row):
-                if val is None:
-                    val = 0
-                try:
-                    cleaned_value = float(val)
-                except ValueError:
-                    cleaned_value = 0
-
-                cleaned_matrix[i].append(cleaned_value)
+    def clean_matrix(matrix) -> np.ndarray:
+        """
+        Convert a matrix to a float64 array. Empty cells and cells that can not be parsed as floats become 0.
+        Arrays and purely numerical input are converted without visiting individual cells.
+        Writable arrays are copied, so the DSM never shares its matrix with the caller. Read-only and
+        memory-mapped float64 arrays are used as they are.
+        :param matrix: List matrix or array
+        :return: Cleaned matrix
+        """
+        shared = isinstance(matrix, np.memmap) or (isinstance(matrix, np.ndarray) and not matrix.flags.writeable)
+        try:
+            cleaned_matrix = np.asarray(matrix, dtype=np.float64) if shared else np.array(matrix, dtype=np.float64)
+        except (TypeError, ValueError):
+            cleaned_matrix = DSM._clean_cells(matrix)
+
+        if cleaned_matrix.ndim != 2:
+            raise ValueError('Matrix dimensions are inconsistent with provided columns.')
+
+        # Empty cells (None) are converted to NaN by numpy
+        empty_cells = np.isnan(cleaned_matrix)
+        if empty_cells.any():
+            cleaned_matrix = np.where(empty_cells, 0.0, cleaned_matrix)
 
         return cleaned_matrix
 
+    @staticmethod
+    def _clean_cells(matrix) -> np.ndarray:
+        rows = [list(row) for row in matrix]
+        if len(set(len(row) for row in rows)) > 1:
+            raise ValueError('Matrix dimensions are inconsistent with provided columns.')
+
+        cells = np.empty((len(rows), len(rows[0]) if rows else 0), dtype=object)
+        cells[:] = rows
+
+        return _cell_to_float(cells).astype(np.float64)
+
     def validate_matrix(self):
-        try:
-            assert len(self.matrix) == len(self.columns)
-            for row in self.matrix:
-                assert len(row) == len(self.columns)
-        except AssertionError:
+        if self.matrix.shape != (len(self.columns), len(self.columns)):
             raise ValueError('Matrix dimensions are inconsistent with provided columns.')
 
     def __str__(self):
         return f'{self.columns}\n{self.matrix}'
 
-    def build_node_network(self, instigator: str) -> dict[int, 'GraphNode']:
+    def build_adjacency(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Construct the CSR neighbour index of the DSM.
+        **This is done on DSM class instantiation and should probably not be done manually**
+        :return: indptr, indices and data arrays
+        """
+        # Rows of the adjacency are instigators, columns are receivers
+        adjacency = self.matrix.T != 0
+        # Ignore diagonal
+        np.fill_diagonal(adjacency, False)
+
+        instigators, receivers = np.nonzero(adjacency)
+        indptr = np.zeros(len(self.columns) + 1, dtype=np.intp)
+        np.cumsum(adjacency.sum(axis=1), out=indptr[1:])
+        data = self.matrix[receivers, instigators]
+
+        return indptr, receivers.astype(np.intp), data
+
+    def distances_from(self, source: int, max_depth: int) -> np.ndarray:
+        """
+        Get the number of interactions on the shortest path from a sub-system to every sub-system, using a
+        breadth-first search over the neighbour index. Distances beyond `max_depth` are only known to be larger
+        than `max_depth`, and are reported as `max_depth + 1`.
+        :param source: Index of the instigating sub-system
+        :param max_depth: Largest distance of interest, typically the search depth
+        :return: Hop distance to every sub-system
+        """
+        return _breadth_first(self.indptr, self.indices, [source], max_depth)
+
+    def distances_to(self, target: int, max_depth: int) -> np.ndarray:
+        """
+        Get the number of interactions on the shortest path from every sub-system to a target, see
+        `distances_from()`. The search runs backwards over the interactions, and is cached on the DSM per target.
+        :param target: Index of the receiving sub-system
+        :param max_depth: Largest distance of interest, typically the search depth
+        :return: Hop distance from every sub-system
+        """
+        cached = self._distances.get(target)
+        if cached is not None and cached[0] >= max_depth:
+            return cached[1]
+
+        indptr, indices = self.reverse_adjacency
+        distances = _breadth_first(indptr, indices, [target], max_depth)
+        self._distances[target] = (max_depth, distances)
+
+        return distances
+
+    @property
+    def reverse_adjacency(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        CSR index of the interactions by receiver: the instigators of receiver ``i`` are
+        ``indices[indptr[i]:indptr[i + 1]]``. It is built from the neighbour index on first access.
+        """
+        if self._reverse is None:
+            instigators = np.repeat(np.arange(len(self.columns)), np.diff(self.indptr))
+            order = np.argsort(self.indices, kind='stable')
+            indptr = np.zeros(len(self.columns) + 1, dtype=np.intp)
+            np.cumsum(np.bincount(self.indices, minlength=len(self.columns)), out=indptr[1:])
+            self._reverse = (indptr, instigators[order])
+
+        return self._reverse
+
+    def set_value(self, row: int, column: int, value: Optional[float]):
+        """
+        Change a cell of the DSM, and update the neighbour indices, node network and hop distances accordingly.
+        Only the interactions of the changed instigator and receiver are updated in the indices. Cached hop
+        distances to a target are dropped if the change can alter them, and searched again when needed.
+        Interactions should only be changed through this method, not by editing `matrix` or `node_network`.
+        Every changed cell increments `edits`, which lets dependent objects detect the change.
+        :param row: Row of the cell, as in the DSM input
+        :param column: Column of the cell, as in the DSM input
+        :param value: New value. None empties the cell.
+        """
+        value = 0.0 if value is None else float(value)
+        if self.instigator == 'row':
+            instigator, receiver = row, column
+        else:
+            instigator, receiver = column, row
+
+        if not self.matrix.flags.writeable:
+            # E.g. a memory-mapped file
+            self.matrix = np.array(self.matrix)
+
+        previous = self.matrix[receiver, instigator]
+        self.matrix[receiver, instigator] = value
+
+        if previous == value:
+            return
+        self.edits += 1
+        if instigator == receiver:
+            return
+
+        # Neighbours are sorted within the slice of each instigator
+        start, end = self.indptr[instigator], self.indptr[instigator + 1]
+        position = start + np.searchsorted(self.indices[start:end], receiver)
+        if previous != 0 and value != 0:
+            self.data[position] = value
+        elif value != 0:
+            self.indices = np.insert(self.indices, position, receiver)
+            self.data = np.insert(self.data, position, value)
+            self.indptr[instigator + 1:] += 1
+        else:
+            self.indices = np.delete(self.indices, position)
+            self.data = np.delete(self.data, position)
+            self.indptr[instigator + 1:] -= 1
+
+        if self._node_network is not None:
+            neighbours = self._node_network[instigator].neighbours
+            if value != 0:
+                neighbours[receiver] = value
+            else:
+                neighbours.pop(receiver, None)
+
+        if (previous == 0) == (value == 0):
+            return
+
+        if self._reverse is not None:
+            indptr, indices = self._reverse
+            start, end = indptr[receiver], indptr[receiver + 1]
+            position = start + np.searchsorted(indices[start:end], instigator)
+            if value != 0:
+                indices = np.insert(indices, position, instigator)
+                indptr[receiver + 1:] += 1
+            else:
+                indices = np.delete(indices, position)
+                indptr[receiver + 1:] -= 1
+            self._reverse = (indptr, indices)
+
+        for target, (_, distances) in list(self._distances.items()):
+            through = 1 + distances[receiver]
+            if value != 0:
+                # An added interaction matters if it is a shortcut towards the target
+                stale = distances[instigator] > through
+            else:
+                # A removed interaction matters if it is on a shortest path to the target
+                stale = distances[instigator] == through
+            if stale:
+                del self._distances[target]
+
+    def save(self, path: str, metadata: Optional[dict] = None):
+        """
+        Save the DSM in the binary matrix format, see `cpm.storage`.
+        :param path: Target file
+        :param metadata: JSON serializable metadata
+        """
+        from cpm.storage import save_dsm
+        save_dsm(self, path, metadata=metadata)
+
+    @staticmethod
+    def load(path: str, mmap: bool = True) -> 'DSM':
+        """
+        Load a DSM saved with `DSM.save()`. With `mmap`, the matrix is memory-mapped instead of copied.
+        :param path: Source file
+        :param mmap: Memory-map the matrix data
+        :return: DSM
+        """
+        from cpm.storage import load_dsm
+        return load_dsm(path, mmap=mmap)
+
+    @property
+    def node_network(self) -> dict[int, 'GraphNode']:
+        """
+        Node network view of the DSM. It is built from the CSR neighbour index on first access.
+        """
+        if self._node_network is None:
+            self._node_network = self.build_node_network()
+
+        return self._node_network
+
+    def build_node_network(self) -> dict[int, 'GraphNode']:
         """
         Construct a node network using the DSM.
         This enables path finding to be run on the system.\n
-        **This is done on DSM class instantiation and should probably not be done manually**
+        **This is done when `node_network` is first accessed and should probably not be done manually**
         :return:
         """
-        if instigator == 'row':
-            # Transpose. Calculation is always performed as if columns are the instigators.
-            self.matrix = list(zip(*self.matrix))
+        indptr = self.indptr.tolist()
+        indices = self.indices.tolist()
+        data = self.data.tolist()
 
         network_dict = {}
         for index, col in enumerate(self.columns):
-            network_dict[index] = GraphNode(index, col)
+            node = GraphNode(index, col)
+            node.neighbours = dict(zip(indices[indptr[index]:indptr[index + 1]],
+                                       data[indptr[index]:indptr[index + 1]]))
+            network_dict[index] = node
 
-        for i, row in enumerate(self.matrix):
-            for j, col in enumerate(row):
-                # Ignore diagonal
-                if i == j:
-                    continue
-                # Ignore empty connections
-                if col == "" or col is None or col == 0:
-                    continue
+        return network_dict
 
-                numerical_value = 0.0
 
-                try:
-                    numerical_value = float(col)
-                except ValueError:
-                    raise ValueError('Unexpected DSM cell value. Could not be parsed as a float. Control DSM input.')
+def _parse_cell(val) -> float:
+    if val is None:
+        return 0.0
+    try:
+        return float(val)
+    except (TypeError, ValueError):
+        return 0.0
 
-                # Add interaction to node network
-                network_dict[j].add_neighbour(network_dict[i], numerical_value)  # Assumes cell only contains a float.
 
-        return network_dict
+_cell_to_float = np.frompyfunc(_parse_cell, 1, 1)
+
+
+def _breadth_first(indptr: np.ndarray, indices: np.ndarray, starts, max_depth: int) -> np.ndarray:
+    """
+    Hop distances from the start nodes over a CSR index, up to `max_depth`. Other nodes get `max_depth + 1`.
+    """
+    distances = np.full(len(indptr) - 1, max_depth + 1, dtype=np.int32)
+    frontier = np.asarray(starts, dtype=np.intp)
+    distances[frontier] = 0
+
+    for hop in range(1, max_depth + 1):
+        # Positions of the neighbours of every frontier node in `indices`
+        begins = indptr[frontier]
+        counts = indptr[frontier + 1] - begins
+        total = int(counts.sum())
+        if total == 0:
+            break
+        positions = np.repeat(begins - np.cumsum(counts) + counts, counts) + np.arange(total)
+
+        reached = indices[positions]
+        frontier = np.unique(reached[distances[reached] > hop])
+        if len(frontier) == 0:
+            break
+        distances[frontier] = hop
+
+    return distances
 
 
 class GraphNode:
@@ -107,6 +334,8 @@ class GraphNode:
 
 
 class ChangePropagationLeaf:
+    __slots__ = ('node', 'impact_node', 'parent', 'level', 'next')
+
     def __init__(self, node: GraphNode, impact_node: GraphNode, parent: 'ChangePropagationLeaf' = None):
         self.node: GraphNode = node
         self.impact_node: GraphNode = impact_node
@@ -115,14 +344,10 @@ class ChangePropagationLeaf:
         self.next: dict[int, 'ChangePropagationLeaf'] = {}  # index -> leaf
 
     def set_level(self):
-        level = 0
-        node = self.parent
-
-        while node:
-            level += 1
-            node = node.parent
+        if self.parent is None:
+            return 0
 
-        return level
+        return self.parent.level + 1
 
     def get_probability(self, stack=0):
 
@@ -174,9 +399,23 @@ class ChangePropagationLeaf:
         return 1 - prob
 
 
+def validate_dsm_pair(dsm_impact: DSM, dsm_likelihood: DSM):
+    """
+    Ensure that an impact DSM and a likelihood DSM can be used together.
+    :param dsm_impact: Impact DSM
+    :param dsm_likelihood: Likelihood DSM
+    """
+    if dsm_impact.instigator != dsm_likelihood.instigator:
+        raise ValueError('DSMs have DIFFERENT instigators, but they need to be the same (row or column).')
+
+    if len(dsm_impact.matrix) != len(dsm_likelihood.matrix):
+        raise ValueError('Impact and Likelihood matrices need to have the same dimensions.')
+
+
 class ChangePropagationTree:
     """
-    Used to calculate how the start node affects the end node
+    Used to calculate how the start node affects the end node.
+    The tree is stored in flat arrays indexed by leaf id, in breadth-first order. Leaf 0 is the start leaf.
     """
     def __init__(self, start_index: int, target_index: int, dsm_impact: DSM, dsm_likelihood: DSM):
         """
@@ -186,82 +425,318 @@ class ChangePropagationTree:
         :param dsm_impact: Impact DSM
         :param dsm_likelihood: Likelihood DSM
         """
-        if dsm_impact.instigator != dsm_likelihood.instigator:
-            raise ValueError('DSMs have DIFFERENT instigators, but they need to be the same (row or column).')
+        validate_dsm_pair(dsm_impact, dsm_likelihood)
 
         if dsm_impact.instigator == 'row':
             temp = start_index
             start_index = target_index
             target_index = temp
 
-        if len(dsm_impact.matrix) != len(dsm_likelihood.matrix):
-            raise ValueError('Impact and Likelihood matrices need to have the same dimensions.')
+        self._setup(start_index, target_index, dsm_impact, dsm_likelihood)
 
+    @classmethod
+    def _unchecked(cls, start_index: int, target_index: int, dsm_impact: DSM,
+                   dsm_likelihood: DSM) -> 'ChangePropagationTree':
+        # For callers that validated the DSM pair already. Indices are not swapped for row instigators.
+        tree = cls.__new__(cls)
+        tree._setup(start_index, target_index, dsm_impact, dsm_likelihood)
+        return tree
+
+    def _setup(self, start_index: int, target_index: int, dsm_impact: DSM, dsm_likelihood: DSM):
         self.dsm_impact: DSM = dsm_impact
         self.dsm_likelihood: DSM = dsm_likelihood
         self.start_index: int = start_index
         self.target_index: int = target_index
-        self.start_leaf: Optional[ChangePropagationLeaf] = None
-
-    def propagate_back(self, end_leaf: ChangePropagationLeaf):
-        current_leaf = end_leaf
-
-        while current_leaf:
-            if current_leaf.parent:
-                current_leaf.parent.next[current_leaf.node.index] = current_leaf
-
-            current_leaf = current_leaf.parent
-
-    def propagate(self, search_depth: int = 4) -> 'ChangePropagationTree':
+        self._start_leaf: Optional[ChangePropagationLeaf] = None
+        # Risk and probability, when evaluated depth-first, and their upper bounds
+        self._values: Optional[tuple[float, float]] = None
+        self._upper: Optional[tuple[float, float]] = None
+
+        # Leaf arrays
+        self._parent: list[int] = []
+        self._node: list[int] = []
+        self._level: list[int] = []
+        self._visited: list[int] = []       # Bitmask of the nodes on the path to the leaf
+        self._likelihood: list[float] = []  # Likelihood of propagating from the parent to the leaf
+        # Leaves on paths that reach the target, per level, in the order the paths were found
+        self._paths_by_level: list[list[int]] = []
+        # Length of the shortest path through each of those leaves. Non-decreasing within a level.
+        self._reach_by_level: list[list[int]] = []
+
+    def propagate(self, search_depth: int = 4, strategy: str = 'breadth',
+                  epsilon: Optional[float] = None) -> 'ChangePropagationTree':
         """
         Propagate change. This will determine the paths of possible propagation within the system.
         Use `get_risk()` and `get_probability()` to extract the corresponding values.
         :param search_depth:
+        :param strategy: **breadth** builds the full tree of propagation paths.
+        **depth** evaluates risk and probability during a depth-first search instead, and only keeps the
+        current path in memory. The tree (`start_leaf`) is then not available.
+        :param epsilon: Approximate propagation, only available with the **depth** strategy. Branches where the
+        product of the likelihoods from the start falls below epsilon are not explored. Use `get_error_bound()`
+        to get the largest possible error of the risk.
         :return:
         """
-        network = self.dsm_likelihood.node_network
+        if strategy not in ['breadth', 'depth']:
+            raise ValueError('strategy argument needs to be either "breadth" or "depth".')
+        if epsilon is not None and strategy != 'depth':
+            raise ValueError('epsilon is only supported by the "depth" strategy.')
+        if epsilon is not None and epsilon < 0:
+            raise ValueError('epsilon needs to be a non-negative number.')
+
+        stats = active_stats()
+        if stats is not None:
+            began = perf_counter()
+
+        self._values = None
+        self._upper = None
+        if strategy == 'depth':
+            self._parent, self._node, self._level, self._visited, self._likelihood = [], [], [], [], []
+            self._paths_by_level, self._reach_by_level = [], []
+            self._start_leaf = None
+            risk, prob, risk_upper, prob_upper, counters = self._propagate_depth_first(search_depth, epsilon)
+            self._values = (risk, prob)
+            self._upper = (risk_upper, prob_upper)
+        else:
+            counters = self._propagate_breadth_first(search_depth)
+
+        if stats is not None:
+            if strategy == 'breadth':
+                counters['leaves'] = len(self._node)
+                counters['target_paths'] = self._node.count(self.target_index) if len(self._node) > 1 else 0
+                counters['max_frontier'] = max(Counter(self._level).values())
+            columns = self.dsm_likelihood.columns
+            stats.record('propagate', perf_counter() - began, source=columns[self.start_index],
+                         target=columns[self.target_index], **counters)
 
-        self.start_leaf = ChangePropagationLeaf(network[self.start_index], self.dsm_impact.node_network[self.start_index])
-        search_stack = [self.start_leaf]
-        end_leafs: list[ChangePropagationLeaf] = []
+        return self
 
-        while len(search_stack) > 0:
-            current_leaf = search_stack.pop(0)
+    def _propagate_breadth_first(self, search_depth: int) -> dict[str, int]:
+        dsm = self.dsm_likelihood
+        indptr = dsm.indptr.tolist()
+        target = self.target_index
+        cycle_pruned = 0
+        depth_pruned = 0
+
+        parents = self._parent = [-1]
+        nodes = self._node = [self.start_index]
+        levels = self._level = [0]
+        visited = self._visited = [1 << self.start_index]
+        likelihoods = self._likelihood = [0.0]
+        on_path = [False]
+        paths_by_level = self._paths_by_level = [[] for _ in range(search_depth + 1)]
+        reach_by_level = self._reach_by_level = [[] for _ in range(search_depth + 1)]
+        self._start_leaf = None
+
+        # Hop distance from every sub-system to the target. Branches that can not reach the target
+        # within the remaining search depth are never expanded.
+        distance_to_target = dsm.distances_to(target, search_depth).tolist()
+        if distance_to_target[self.start_index] > search_depth:
+            return {'cycle_pruned': 0, 'depth_pruned': 0}
+
+        # The leaf arrays double as the breadth-first queue
+        head = 0
+        while head < len(nodes):
+            leaf = head
+            head += 1
+            node = nodes[leaf]
+
+            if node == target:
+                # Register the path back towards the start leaf
+                reach = levels[leaf]
+                while leaf > 0 and not on_path[leaf]:
+                    on_path[leaf] = True
+                    paths_by_level[levels[leaf]].append(leaf)
+                    reach_by_level[levels[leaf]].append(reach)
+                    leaf = parents[leaf]
+                continue
 
-            if current_leaf.node.index == self.target_index:
-                end_leafs.append(current_leaf)
+            level = levels[leaf] + 1
+            mask = visited[leaf]
+            start, end = indptr[node], indptr[node + 1]
 
-                # Propagate back and register path
-                self.propagate_back(current_leaf)
+            for neighbour, likelihood in zip(dsm.indices[start:end].tolist(), dsm.data[start:end].tolist()):
+                # Do not create circular paths
+                if mask >> neighbour & 1:
+                    cycle_pruned += 1
+                    continue
 
-                continue
+                if level + distance_to_target[neighbour] > search_depth:
+                    depth_pruned += 1
+                    continue
 
-            for neighbour in current_leaf.node.neighbours:
-
-                # Trace back and ensure that we do not create circular paths
-                leaf_back_trace = current_leaf
-                already_visited = False
-                while leaf_back_trace.parent:
-                    if neighbour == leaf_back_trace.parent.node.index:
-                        already_visited = True
-                        break
-                    leaf_back_trace = leaf_back_trace.parent
-                if already_visited:
+                parents.append(leaf)
+                nodes.append(neighbour)
+                levels.append(level)
+                visited.append(mask | 1 << neighbour)
+                likelihoods.append(likelihood)
+                on_path.append(False)
+
+        return {'cycle_pruned': cycle_pruned, 'depth_pruned': depth_pruned}
+
+    def _propagate_depth_first(self, search_depth: int, epsilon: Optional[float]) \
+            -> tuple[float, float, float, float, dict[str, int]]:
+        dsm = self.dsm_likelihood
+        indptr = dsm.indptr.tolist()
+        indices = dsm.indices.tolist()
+        data = dsm.data.tolist()
+        impact_network = self.dsm_impact.node_network
+        target = self.target_index
+        distance_to_target = dsm.distances_to(target, search_depth).tolist()
+        # Expanded and unexplored leaves, cycle pruned, depth pruned, target paths and leaves on the longest path
+        counts = [0, 0, 0, 0, 1]
+
+        def descend(node: int, visited: int, remaining: int, mass: float) \
+                -> Optional[tuple[float, float, int, float, float]]:
+            # Shortest path length, risk factor and probability factor of each branch that reaches the target,
+            # followed by the factors of the upper bounds
+            branches = []
+            counts[0] += 1
+
+            for k in range(indptr[node], indptr[node + 1]):
+                neighbour = indices[k]
+                if visited >> neighbour & 1:
+                    counts[1] += 1
+                    continue
+                if 1 + distance_to_target[neighbour] > remaining:
+                    counts[2] += 1
                     continue
 
-                cpf = ChangePropagationLeaf(network[neighbour], self.dsm_impact.node_network[neighbour], current_leaf)
+                if neighbour == target:
+                    counts[3] += 1
+                    impacts = impact_network[node].neighbours
+                    if target not in impacts:
+                        raise ValueError('Unexpected empty DSM cell. The final impact cell was null. '
+                                         'Check if DSMs are valid.')
+                    risk, prob, depth = impacts[target], 1, 0
+                    risk_upper, prob_upper = risk, prob
+                elif epsilon is not None and mass * data[k] < epsilon:
+                    # Not explored. The branch may reach the target with certainty.
+                    counts[0] += 1
+                    risk, prob, depth = 0, 0, distance_to_target[neighbour]
+                    risk_upper, prob_upper = 1, 1
+                else:
+                    branch = descend(neighbour, visited | 1 << neighbour, remaining - 1, mass * data[k])
+                    if branch is None:
+                        continue
+                    risk, prob, depth, risk_upper, prob_upper = branch
+
+                branches.append((depth + 1, 1 - data[k] * risk, 1 - data[k] * prob,
+                                 1 - data[k] * risk_upper, 1 - data[k] * prob_upper))
+
+            if not branches:
+                return None
+            counts[4] = max(counts[4], search_depth - remaining + 2)
+
+            # Same order as the breadth-first tree: branches that reach the target sooner come first
+            branches.sort(key=lambda branch: branch[0])
+
+            risk_remainder = 1
+            prob_remainder = 1
+            for _, risk_factor, prob_factor, _, _ in branches:
+                risk_remainder = risk_remainder * risk_factor
+                prob_remainder = prob_remainder * prob_factor
+
+            if epsilon is None:
+                return 1 - risk_remainder, 1 - prob_remainder, branches[0][0], 1 - risk_remainder, 1 - prob_remainder
+
+            risk_upper_remainder = 1
+            prob_upper_remainder = 1
+            for _, _, _, risk_factor, prob_factor in branches:
+                risk_upper_remainder = risk_upper_remainder * risk_factor
+                prob_upper_remainder = prob_upper_remainder * prob_factor
+
+            return (1 - risk_remainder, 1 - prob_remainder, branches[0][0],
+                    1 - risk_upper_remainder, 1 - prob_upper_remainder)
+
+        if self.start_index == target or distance_to_target[self.start_index] > search_depth:
+            # These nodes are not connected.
+            return 0, 0, 0, 0, {'leaves': 1, 'max_frontier': 1}
+
+        result = descend(self.start_index, 1 << self.start_index, search_depth, 1.0)
+        counters = {'leaves': counts[0] + counts[3], 'cycle_pruned': counts[1], 'depth_pruned': counts[2],
+                    'target_paths': counts[3], 'max_frontier': counts[4]}
+        if result is None:
+            return 0, 0, 0, 0, counters
+
+        return result[0], result[1], result[3], result[4], counters
+
+    def _evaluate(self, risk: bool, search_depth: Optional[int] = None) -> float:
+        if self._values is not None:
+            return self._values[0] if risk else self._values[1]
+
+        if len(self._paths_by_level) < 2 or not self._paths_by_level[1]:
+            # These nodes are not connected.
+            return 0
 
-                if cpf.level <= search_depth:
-                    search_stack.append(cpf)
+        paths_by_level = self._paths_by_level
+        if search_depth is not None:
+            # Paths are found shortest first, so the tree of a shallower search is a prefix of every level
+            paths_by_level = [paths[:bisect_right(reach, search_depth)]
+                              for paths, reach in zip(paths_by_level[:search_depth + 1], self._reach_by_level)]
+
+        parents = self._parent
+        nodes = self._node
+        likelihoods = self._likelihood
+        impact_network = self.dsm_impact.node_network
+        target = self.target_index
+
+        # Product of the complements of each leaf's branches. Deepest leaves are evaluated first, and each
+        # leaf's branches are combined in the order they were found.
+        remainder = {0: 1.0}
+        for level in range(len(paths_by_level) - 1, 0, -1):
+            for leaf in paths_by_level[level]:
+                parent = parents[leaf]
+                if nodes[leaf] != target:
+                    value = 1 - remainder[leaf]
+                elif not risk:
+                    value = 1
+                else:
+                    # Final connection is the only one where we care about impact
+                    impacts = impact_network[nodes[parent]].neighbours
+                    if target not in impacts:
+                        raise ValueError('Unexpected empty DSM cell. The final impact cell was null. '
+                                         'Check if DSMs are valid.')
+                    value = impacts[target]
+
+                remainder[parent] = remainder.get(parent, 1.0) * (1 - likelihoods[leaf] * value)
+
+        return 1 - remainder.get(0, 1.0)
+
+    @property
+    def start_leaf(self) -> Optional[ChangePropagationLeaf]:
+        """
+        Start leaf of the tree as linked `ChangePropagationLeaf` objects. Only paths that reach the target are
+        included. The objects are created on first access.
+        """
+        if self._start_leaf is None and self._node:
+            network = self.dsm_likelihood.node_network
+            impact_network = self.dsm_impact.node_network
 
-        return self
+            leaves = {0: ChangePropagationLeaf(network[self.start_index], impact_network[self.start_index])}
+            for paths in self._paths_by_level:
+                for leaf in paths:
+                    node = self._node[leaf]
+                    parent = leaves[self._parent[leaf]]
+                    leaves[leaf] = ChangePropagationLeaf(network[node], impact_network[node], parent)
+                    parent.next[node] = leaves[leaf]
+
+            self._start_leaf = leaves[0]
+
+        return self._start_leaf
 
     def get_risk(self) -> float:
         """
         Get risk of propagation
         :return:
         """
-        risk = self.start_leaf.get_risk()
+        stats = active_stats()
+        if stats is None:
+            return self._evaluate(risk=True)
+
+        began = perf_counter()
+        risk = self._evaluate(risk=True)
+        stats.record('get_risk', perf_counter() - began)
 
         return risk
 
@@ -270,5 +745,45 @@ class ChangePropagationTree:
         Get probability/likelihood of propagation
         :return:
         """
-        prob = self.start_leaf.get_probability()
+        stats = active_stats()
+        if stats is None:
+            return self._evaluate(risk=False)
+
+        began = perf_counter()
+        prob = self._evaluate(risk=False)
+        stats.record('get_probability', perf_counter() - began)
         return prob
+
+    def get_error_bound(self) -> float:
+        """
+        Get the largest possible error of the risk of an approximate propagation, see `propagate()`.
+        The exact risk lies between `get_risk()` and `get_risk()` plus the bound. The bound assumes that
+        likelihoods and impacts are between 0 and 1.
+        :return: Error bound. 0 for exact propagation.
+        """
+        if self._upper is None:
+            return 0
+
+        return self._upper[0] - self._values[0]
+
+    def get_risk_by_depth(self) -> list[float]:
+        """
+        Get risk of propagation for every search depth up to the one the tree was propagated with.
+        The tree is not propagated again.
+        :return: Risk for search depths 1, 2, ..., search_depth
+        """
+        return [self._evaluate(risk=True, search_depth=depth) for depth in self._depths()]
+
+    def get_probability_by_depth(self) -> list[float]:
+        """
+        Get probability/likelihood of propagation for every search depth up to the one the tree was
+        propagated with. The tree is not propagated again.
+        :return: Probability for search depths 1, 2, ..., search_depth
+        """
+        return [self._evaluate(risk=False, search_depth=depth) for depth in self._depths()]
+
+    def _depths(self) -> range:
+        if self._values is not None:
+            raise ValueError('Values by search depth require a tree propagated with the "breadth" strategy.')
+
+        return range(1, len(self._paths_by_level))
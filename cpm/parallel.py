@@ -0,0 +1,249 @@
+from concurrent.futures import Executor, ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+from typing import Iterator, Optional
+import math
+import os
+import threading
+import numpy as np
+from cpm.instrumentation import PropagationStats, active_stats
+from cpm.models import DSM, validate_dsm_pair
+from cpm.propagation import SourcePropagation
+
+
+class SharedDSMPair:
+    """
+    Publishes the matrices of an impact and a likelihood DSM in shared memory.
+    Worker processes attach to the published matrices using `spec`, so the DSMs are never pickled into tasks.
+    Use as a context manager to release the shared memory afterwards.
+    """
+
+    def __init__(self, dsm_impact: DSM, dsm_likelihood: DSM):
+        validate_dsm_pair(dsm_impact, dsm_likelihood)
+
+        self.size: int = len(dsm_likelihood.columns)
+        self._blocks: list[shared_memory.SharedMemory] = []
+
+        names = []
+        for dsm in [dsm_impact, dsm_likelihood]:
+            # Matrices are published in propagation orientation (columns instigate)
+            block = shared_memory.SharedMemory(create=True, size=max(dsm.matrix.nbytes, 1))
+            self._blocks.append(block)
+            np.ndarray(dsm.matrix.shape, dtype=np.float64, buffer=block.buf)[:] = dsm.matrix
+            names.append(block.name)
+
+        self.spec: tuple[str, str, int] = (names[0], names[1], self.size)
+
+    def close(self):
+        _detach(self.spec)
+        for block in self._blocks:
+            block.close()
+            block.unlink()
+        self._blocks = []
+
+    def __enter__(self) -> 'SharedDSMPair':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+# Shared DSM pairs attached by this process, oldest first
+_MAX_ATTACHED = 4
+_attached: dict[tuple[str, str, int], tuple[list[shared_memory.SharedMemory], DSM, DSM]] = {}
+# Number of running tasks per attached pair, and detached pairs whose buffers are closed once their tasks finish
+_users: dict[tuple[str, str, int], int] = {}
+_retired: dict[tuple[str, str, int], list[shared_memory.SharedMemory]] = {}
+_attach_lock = threading.RLock()
+
+
+def _attach(spec: tuple[str, str, int]) -> tuple[DSM, DSM]:
+    """
+    Attach to a shared DSM pair. Every call needs to be matched by a call to `_release()`.
+    """
+    with _attach_lock:
+        if spec not in _attached:
+            for other in list(_attached)[:max(0, len(_attached) - _MAX_ATTACHED + 1)]:
+                _detach(other)
+
+            impact_name, likelihood_name, size = spec
+            columns = [str(index) for index in range(size)]
+            blocks = []
+            dsms = []
+            for name in [impact_name, likelihood_name]:
+                block = shared_memory.SharedMemory(name=name)
+                blocks.append(block)
+                matrix = np.ndarray((size, size), dtype=np.float64, buffer=block.buf)
+                # Read-only, so the DSM uses the shared memory without a copy
+                matrix.flags.writeable = False
+                dsms.append(DSM(matrix, columns))
+
+            _attached[spec] = (blocks, dsms[0], dsms[1])
+
+        _, dsm_impact, dsm_likelihood = _attached[spec]
+        _users[spec] = _users.get(spec, 0) + 1
+
+    return dsm_impact, dsm_likelihood
+
+
+def _release(spec: tuple[str, str, int]):
+    with _attach_lock:
+        _users[spec] -= 1
+        if _users[spec] == 0:
+            del _users[spec]
+            if spec in _retired:
+                _close(_retired.pop(spec))
+
+
+def _detach(spec: tuple[str, str, int]):
+    with _attach_lock:
+        attached = _attached.pop(spec, None)
+        if attached is None:
+            return
+
+        # Release the array views before the buffers are closed
+        blocks = attached[0]
+        del attached
+        if spec in _users:
+            # Tasks in other threads of this process still read the matrices
+            _retired[spec] = blocks
+        else:
+            _close(blocks)
+
+
+def _close(blocks: list[shared_memory.SharedMemory]):
+    for block in blocks:
+        try:
+            block.close()
+        except BufferError:
+            # A view of the buffer is still referenced. The mapping is released with it.
+            pass
+
+
+def propagate_chunk(spec: tuple[str, str, int], sources: list[int], search_depth: int,
+                    path_statistics: bool = False, depth_sweep: bool = False,
+                    epsilon: Optional[float] = None, instrument: bool = False) -> tuple:
+    """
+    Propagate change from a chunk of sources using a shared DSM pair. This runs inside worker processes.
+    :param spec: `SharedDSMPair.spec` of the published DSMs
+    :param sources: Indices of instigating sub-systems
+    :param search_depth: Maximum length of propagation paths
+    :param path_statistics: Also count the propagation paths and their maximum length
+    :param depth_sweep: Calculate the values for every search depth up to `search_depth`
+    :param epsilon: Approximate propagation, see `SourcePropagation`
+    :param instrument: Record the propagation of every source with `PropagationStats`
+    :return: The sources, and blocks with the values from each source (rows) to every target (columns).
+    The blocks are stacked as risk and probability, followed by path count and maximum path length
+    if `path_statistics` is set, or the upper bounds of risk and probability if `epsilon` is set.
+    With `depth_sweep`, every row holds one vector per search depth, see `SourcePropagation.propagate_by_depth()`.
+    With `instrument`, the recorded calls follow, to be passed to `record_calls()` in the parent process.
+    """
+    dsm_impact, dsm_likelihood = _attach(spec)
+    try:
+        if not instrument:
+            return sources, _propagate_sources(dsm_impact, dsm_likelihood, sources, search_depth, path_statistics,
+                                               depth_sweep, epsilon)
+
+        calls = []
+        with PropagationStats(callback=calls.append, slowest=0):
+            blocks = _propagate_sources(dsm_impact, dsm_likelihood, sources, search_depth, path_statistics,
+                                        depth_sweep, epsilon)
+        return sources, blocks, calls
+    finally:
+        _release(spec)
+
+
+def record_calls(calls: list[dict]):
+    """
+    Record calls that were recorded by a worker, see `propagate_chunk()`, in the stats that are active in the
+    current context.
+    :param calls: Recorded calls, as passed to the callback of `PropagationStats`
+    """
+    stats = active_stats()
+    if stats is not None:
+        for call in calls:
+            stats.record(**call)
+
+
+def _propagate_sources(dsm_impact: DSM, dsm_likelihood: DSM, sources: list[int], search_depth: int,
+                       path_statistics: bool, depth_sweep: bool, epsilon: Optional[float]) -> np.ndarray:
+    propagation = SourcePropagation(dsm_impact, dsm_likelihood, search_depth=search_depth, epsilon=epsilon)
+
+    if epsilon is not None:
+        propagate = propagation.propagate_bounds
+    elif depth_sweep:
+        propagate = propagation.propagate_by_depth
+    elif path_statistics:
+        propagate = propagation.propagate_statistics
+    else:
+        propagate = propagation.propagate
+
+    blocks = None
+    for row, source_index in enumerate(sources):
+        values = propagate(source_index)
+        if blocks is None:
+            blocks = np.empty((len(values), len(sources)) + values[0].shape)
+        blocks[:, row] = values
+
+    return blocks
+
+
+def source_chunks(sources: list[int], workers: Optional[int] = None,
+                  chunk_size: Optional[int] = None) -> list[list[int]]:
+    """
+    Split sources into chunks for a pool of workers.
+    :param sources: Indices of instigating sub-systems
+    :param workers: Number of workers. Defaults to the number of CPUs.
+    :param chunk_size: Number of sources per chunk. Defaults to four chunks per worker.
+    :return: Chunks of source indices
+    """
+    if chunk_size is None:
+        pool_size = workers or os.cpu_count() or 1
+        chunk_size = max(1, math.ceil(len(sources) / (pool_size * 4)))
+
+    return [sources[start:start + chunk_size] for start in range(0, len(sources), chunk_size)]
+
+
+def iter_source_chunks(dsm_impact: DSM, dsm_likelihood: DSM, search_depth: int = 4,
+                       workers: Optional[int] = None, executor: Optional[Executor] = None,
+                       chunk_size: Optional[int] = None, path_statistics: bool = False,
+                       depth_sweep: bool = False, epsilon: Optional[float] = None,
+                       sources: Optional[list[int]] = None) -> Iterator[tuple[list[int], np.ndarray]]:
+    """
+    Propagate change from every sub-system in a pool of workers, yielding chunks as they complete.
+    :param dsm_impact: Impact DSM
+    :param dsm_likelihood: Likelihood DSM
+    :param search_depth: Maximum length of propagation paths
+    :param workers: Number of worker processes. If an executor is provided, this only affects chunking.
+    :param executor: Executor that runs the chunks. Defaults to a process pool with `workers` processes.
+    :param chunk_size: Number of sources per task. Defaults to four tasks per worker.
+    :param path_statistics: Also count the propagation paths and their maximum length
+    :param depth_sweep: Calculate the values for every search depth up to `search_depth`
+    :param epsilon: Approximate propagation, see `SourcePropagation`
+    :param sources: Indices of the sub-systems to propagate from. All by default.
+    :return: Iterator of source indices and the corresponding blocks, see `propagate_chunk`
+    """
+    if sources is None:
+        sources = list(range(len(dsm_likelihood.columns)))
+    chunks = source_chunks(sources, workers, chunk_size)
+
+    with SharedDSMPair(dsm_impact, dsm_likelihood) as shared:
+        own_executor = executor is None
+        if own_executor:
+            executor = ProcessPoolExecutor(max_workers=workers)
+
+        # Workers do not share the context of this thread, so they report their stats back
+        instrument = active_stats() is not None
+        futures = [executor.submit(propagate_chunk, shared.spec, chunk, search_depth, path_statistics, depth_sweep,
+                                   epsilon, instrument)
+                   for chunk in chunks]
+        try:
+            for future in as_completed(futures):
+                result = future.result()
+                if instrument:
+                    record_calls(result[2])
+                yield result[0], result[1]
+        finally:
+            for future in futures:
+                future.cancel()
+            if own_executor:
+                executor.shutdown(wait=True, cancel_futures=True)
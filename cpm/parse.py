@@ -1,8 +1,17 @@
+from io import StringIO
+from itertools import chain
+from time import perf_counter
 from typing import TextIO, Union
 from cpm.exceptions import *
+from cpm.instrumentation import active_stats
 from cpm.models import DSM
 from os import listdir
+import csv
 import re
+import numpy as np
+
+# Number of characters used for delimiter detection
+_CHUNK_SIZE = 64 * 1024
 
 
 def parse_csv_dir(dir_path: str, pattern: str = None,  delimiter: str = 'auto',
@@ -33,77 +42,110 @@ def parse_csv_dir(dir_path: str, pattern: str = None,  delimiter: str = 'auto',
 
 def parse_csv(file: Union[str, TextIO], delimiter: str = 'auto', encoding: str = 'utf-8', instigator: str = 'column'):
     """
-    Parse CSV to DSM
+    Parse CSV to DSM. The file is read once, and rows are parsed straight into a float matrix.
+    Empty cells become 0. Cells on the diagonal may contain labels.
     :param file: Targeted CSV file or file-like object
     :param delimiter: CSV delimiter. Defaults to auto-detection.
     :param encoding: text-encoding. Defaults to utf-8
     :param instigator: Determines directionality of DSM. Defaults to columns instigating rows.
     :return: DSM
+    :raises CSVParseError: If a cell outside the diagonal can not be parsed as a float, or if the matrix is not square
     """
-    
-    content = _read_file(file, encoding)
-    
+    stats = active_stats()
+    if stats is not None:
+        began = perf_counter()
+
+    if isinstance(file, str):
+        with open(file, 'r', encoding=encoding, newline='') as f:
+            dsm = _parse_stream(f, delimiter, instigator)
+    elif hasattr(file, 'read'):
+        dsm = _parse_stream(file, delimiter, instigator)
+    else:
+        raise ValueError("Invalid file input. Must be a filepath or a file-like object.")
+
+    if stats is not None:
+        stats.record('parse_csv', perf_counter() - began)
+
+    return dsm
+
+
+def _parse_stream(file: TextIO, delimiter: str, instigator: str) -> DSM:
+    # The first chunk is used for delimiter detection, and then parsed along with the rest of the file
+    chunk = file.read(_CHUNK_SIZE)
+
     if delimiter == 'auto':
-        delimiter = detect_delimiter(content)
+        delimiter = detect_delimiter(chunk)
 
-    # Identify number of rows, and separate header row
-    num_cols = 0
-    column_names = []
-    lines = _get_file_lines(file, encoding)
-    for line in lines:
-        column_names.append(line.split(delimiter)[0])
-        num_cols += 1
+    lines = chain(StringIO(chunk + file.readline()), file)
+
+    if len(delimiter) == 1:
+        rows = csv.reader(lines, delimiter=delimiter)
+    else:
+        rows = (line.rstrip('\r\n').split(delimiter) for line in lines)
 
-    # We do not want the first column in the header
-    column_names.pop(0)
+    header = next(rows, None)
+    if header is None:
+        raise CSVParseError('The file is empty.')
+    while len(header) > 1 and header[-1].strip() == '':
+        header.pop()
 
-    data = []
+    size = len(header) - 1
+    matrix = np.zeros((size, size))
+    column_names = []
 
-    for i, line in enumerate(lines):
-        if i == 0:
+    for line_number, row in enumerate(rows, start=2):
+        if not any(cell.strip() for cell in row):
             continue
-        data.append([])
-        for j, col in enumerate(line.split(delimiter)):
-            if j == 0:
-                continue
-            if col == "":
-                data[i-1].append(None)
-            else:
-                try:
-                    data[i-1].append(float(col))
-                except ValueError:
-                    data[i-1].append(None)
-
-    dsm = DSM(matrix=data, columns=column_names, instigator=instigator)
+
+        i = len(column_names)
+        if i >= size:
+            raise CSVParseError(f'Line {line_number}: The matrix has more rows than the {size} columns of the header.',
+                                row=i)
+
+        column_names.append(row[0])
+        cells = row[1:]
+        if len(cells) != size:
+            if len(cells) < size or any(cell.strip() for cell in cells[size:]):
+                raise CSVParseError(f'Line {line_number}: Expected {size} cells, found {len(cells)}.', row=i)
+            cells = cells[:size]
+
+        # The diagonal commonly holds the name of the sub-system
+        diagonal = cells[i]
+        cells[i] = '0'
+
+        try:
+            matrix[i] = [cell or '0' for cell in cells]
+        except ValueError:
+            matrix[i] = _parse_cells(cells, i, line_number)
+
+        try:
+            matrix[i, i] = float(diagonal or 0)
+        except ValueError:
+            pass
+
+    if len(column_names) != size:
+        raise CSVParseError(f'The matrix has {len(column_names)} rows, but the header has {size} columns.')
+
+    dsm = DSM(matrix=matrix, columns=column_names, instigator=instigator)
 
     return dsm
 
 
-def _read_file(file, encoding):
-    if isinstance(file, str):
-        with open(file, 'r', encoding=encoding) as f:
-            return f.read()
-    elif hasattr(file, 'read'):
-        position = file.tell()
-        content = file.read()
-        file.seek(position)
-        return content
-    else:
-        raise ValueError("Invalid file input. Must be a filepath or a file-like object.")
+def _parse_cells(cells: list[str], row: int, line_number: int) -> list[float]:
+    values = []
+    for j, cell in enumerate(cells):
+        cell = cell.strip()
+        if cell == '':
+            values.append(0.0)
+            continue
 
+        try:
+            values.append(float(cell))
+        except ValueError:
+            raise CSVParseError(f'Line {line_number}, cell {j + 2}: Could not parse "{cell}" as a float '
+                                f'(row {row}, column {j} of the matrix).', row=row, column=j)
 
-def _get_file_lines(file, encoding):
-    if isinstance(file, str):
-        with open(file, 'r', encoding=encoding) as f:
-            return f.readlines()
-    elif hasattr(file, 'read'):
-        position = file.tell()
-        file.seek(0)
-        lines = file.readlines()
-        file.seek(position)
-        return lines
-    else:
-        raise ValueError("Invalid file input. Must be a filepath or a file-like object.")
+    return values
 
 
 def detect_delimiter(text, look_ahead=1000):
@@ -0,0 +1,111 @@
+from itertools import count
+import heapq
+from cpm.models import DSM, validate_dsm_pair
+
+
+class PropagationPath:
+    """
+    A single simple path of change propagation.
+    """
+
+    def __init__(self, nodes: list[int], columns: list[str], likelihood: float, risk: float):
+        """
+        :param nodes: Indices of the sub-systems on the path, in the direction of propagation
+        :param columns: Names of the sub-systems on the path
+        :param likelihood: Product of the likelihoods of the interactions on the path
+        :param risk: Likelihood of the path multiplied by the impact of its final interaction
+        """
+        self.nodes: list[int] = nodes
+        self.columns: list[str] = columns
+        self.likelihood: float = likelihood
+        self.risk: float = risk
+
+    def __len__(self):
+        # Number of interactions
+        return len(self.nodes) - 1
+
+    def __str__(self):
+        return f'{" -> ".join(self.columns)} (likelihood {self.likelihood:.4g}, risk {self.risk:.4g})'
+
+
+def critical_paths(start_index: int, target_index: int, dsm_impact: DSM, dsm_likelihood: DSM, k: int = 10,
+                   search_depth: int = 4, by: str = 'likelihood') -> list[PropagationPath]:
+    """
+    Find the k most likely, or most risky, simple propagation paths between two sub-systems.
+    Paths are explored best first. Since likelihoods and impacts are at most 1, extending a path can not make
+    it more likely, so the search stops as soon as k complete paths are better than every open path.
+    Indices follow the conventions of `ChangePropagationTree`.
+    :param start_index: Column index for start of propagation
+    :param target_index: Column index for propagation target
+    :param dsm_impact: Impact DSM
+    :param dsm_likelihood: Likelihood DSM
+    :param k: Number of paths
+    :param search_depth: Maximum length of propagation paths
+    :param by: Rank paths by **likelihood** or by **risk**
+    :return: Up to k paths, best first
+    """
+    validate_dsm_pair(dsm_impact, dsm_likelihood)
+    if by not in ['likelihood', 'risk']:
+        raise ValueError('by argument needs to be either "likelihood" or "risk".')
+    if k < 1:
+        raise ValueError('k needs to be a positive number.')
+
+    if dsm_impact.instigator == 'row':
+        start_index, target_index = target_index, start_index
+
+    data = dsm_likelihood.data
+    if data.size and (data.min() < 0 or data.max() > 1):
+        raise ValueError('Likelihoods need to be between 0 and 1 to search for the most likely paths.')
+
+    distance_to_target = dsm_likelihood.distances_to(target_index, search_depth).tolist()
+    if start_index == target_index or distance_to_target[start_index] > search_depth:
+        return []
+
+    indptr = dsm_likelihood.indptr.tolist()
+    indices = dsm_likelihood.indices.tolist()
+    likelihoods = data.tolist()
+    impacts = dsm_impact.matrix[target_index]
+
+    # Largest impact of a final interaction, which bounds the risk of every unfinished path
+    best_impact = 1.0
+    if by == 'risk':
+        instigators = [node for node in range(len(dsm_likelihood.columns))
+                       if target_index in indices[indptr[node]:indptr[node + 1]]]
+        final_impacts = impacts[instigators]
+        if final_impacts.min() < 0 or final_impacts.max() > 1:
+            raise ValueError('Impacts need to be between 0 and 1 to search for the most risky paths.')
+        best_impact = float(final_impacts.max())
+
+    # Entries are (-bound, tie breaker, path, likelihood, risk). Risk is None for unfinished paths.
+    tie_breaker = count()
+    heap = [(-best_impact if by == 'risk' else -1.0, next(tie_breaker), (start_index,), 1.0, None)]
+    paths = []
+
+    while heap and len(paths) < k:
+        _, _, path, likelihood, risk = heapq.heappop(heap)
+
+        if risk is not None:
+            columns = [dsm_likelihood.columns[node] for node in path]
+            paths.append(PropagationPath(list(path), columns, likelihood, risk))
+            continue
+
+        node = path[-1]
+        level = len(path)
+        for position in range(indptr[node], indptr[node + 1]):
+            neighbour = indices[position]
+            if neighbour in path or level + distance_to_target[neighbour] > search_depth:
+                continue
+
+            extended = likelihood * likelihoods[position]
+            if neighbour == target_index:
+                impact = float(impacts[node])
+                if impact == 0:
+                    raise ValueError('Unexpected empty DSM cell. The final impact cell was null. '
+                                     'Check if DSMs are valid.')
+                value = extended * impact if by == 'risk' else extended
+                heapq.heappush(heap, (-value, next(tie_breaker), path + (neighbour,), extended, extended * impact))
+            else:
+                bound = extended * best_impact
+                heapq.heappush(heap, (-bound, next(tie_breaker), path + (neighbour,), extended, None))
+
+    return paths
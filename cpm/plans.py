@@ -0,0 +1,249 @@
+from typing import Iterable, Optional
+import numpy as np
+from cpm.models import ChangePropagationTree, DSM, validate_dsm_pair
+
+
+class PlanStep:
+    """
+    A set of leaves that are folded into their parents by a single vectorized operation.
+    All leaves share a level and their position among their siblings, so every parent occurs at most once.
+    """
+    __slots__ = ('leaves', 'parents', 'rows', 'cols', 'is_target')
+
+    def __init__(self, leaves: list[int], parents: list[int], rows: list[int], cols: list[int],
+                 is_target: list[bool]):
+        self.leaves: np.ndarray = np.array(leaves, dtype=np.intp)
+        self.parents: np.ndarray = np.array(parents, dtype=np.intp)
+        # DSM cell of the interaction from the parent to the leaf, in the orientation of the input matrices
+        self.rows: np.ndarray = np.array(rows, dtype=np.intp)
+        self.cols: np.ndarray = np.array(cols, dtype=np.intp)
+        self.is_target: np.ndarray = np.array(is_target, dtype=bool)
+
+
+class PropagationPlan:
+    """
+    The path structure of one or more propagation trees, compiled so that it can be evaluated for many
+    likelihood and impact matrices with the same sparsity pattern at once.
+    Use `compile_pair()` or `compile_risk_matrix()` to create a plan.
+    """
+
+    def __init__(self, trees: Iterable[ChangePropagationTree], shape: tuple[int, ...], instigator: str,
+                 pattern: np.ndarray, search_depth: int):
+        """
+        :param trees: Propagated trees, one per result value
+        :param shape: Shape of the result of a single scenario
+        :param instigator: Instigator of the DSMs the trees were built from
+        :param pattern: Non-empty cells of the likelihood matrix, in the orientation of the input matrices
+        :param search_depth: Search depth the trees were propagated with
+        """
+        self.shape: tuple[int, ...] = shape
+        self.instigator: str = instigator
+        self.pattern: np.ndarray = pattern
+        self.search_depth: int = search_depth
+        self.size: int = len(pattern)
+
+        steps: dict[tuple[int, int], tuple[list, list, list, list, list]] = {}
+        roots = []
+        slots = 0
+
+        for tree in trees:
+            root = slots
+            roots.append(root)
+            slots += 1
+
+            slot_of = {0: root}
+            siblings: dict[int, int] = {}
+            for level, paths in enumerate(tree._paths_by_level):
+                for leaf in paths:
+                    slot_of[leaf] = slots
+                    slots += 1
+
+                    parent = tree._parent[leaf]
+                    rank = siblings.get(parent, 0)
+                    siblings[parent] = rank + 1
+
+                    instigator_index = tree._node[parent]
+                    receiver_index = tree._node[leaf]
+                    if instigator == 'row':
+                        row, col = instigator_index, receiver_index
+                    else:
+                        row, col = receiver_index, instigator_index
+
+                    step = steps.setdefault((level, rank), ([], [], [], [], []))
+                    step[0].append(slot_of[leaf])
+                    step[1].append(slot_of[parent])
+                    step[2].append(row)
+                    step[3].append(col)
+                    step[4].append(receiver_index == tree.target_index)
+
+        # Deepest leaves first. Siblings are folded into their parent in the order the tree found them.
+        self.steps: list[PlanStep] = [PlanStep(*steps[key]) for key in sorted(steps, key=lambda k: (-k[0], k[1]))]
+        self.roots: np.ndarray = np.array(roots, dtype=np.intp)
+        self.slots: int = slots
+
+    def evaluate(self, likelihoods: np.ndarray, impacts: np.ndarray) -> np.ndarray:
+        """
+        Calculate the risk of propagation for a batch of scenarios.
+        :param likelihoods: Likelihood matrices, shaped (K, N, N), or a single (N, N) matrix.
+        Matrices are oriented like the DSM input, i.e. not transposed for row instigators.
+        :param impacts: Impact matrices with the same shape as `likelihoods`
+        :return: Risk for each scenario, shaped (K, *shape), or `shape` for a single matrix
+        """
+        return self._evaluate(likelihoods, impacts)
+
+    def evaluate_probability(self, likelihoods: np.ndarray) -> np.ndarray:
+        """
+        Calculate the probability of propagation for a batch of scenarios.
+        :param likelihoods: Likelihood matrices, shaped (K, N, N), or a single (N, N) matrix
+        :return: Probability for each scenario, shaped (K, *shape), or `shape` for a single matrix
+        """
+        return self._evaluate(likelihoods, None)
+
+    def _evaluate(self, likelihoods: np.ndarray, impacts: Optional[np.ndarray]) -> np.ndarray:
+        likelihoods = np.asarray(likelihoods, dtype=np.float64)
+        single = likelihoods.ndim == 2
+        likelihoods = self._validate_batch(likelihoods)
+        if impacts is not None:
+            impacts = np.asarray(impacts, dtype=np.float64)
+            if impacts.ndim == 2:
+                impacts = impacts[np.newaxis]
+            if impacts.shape != likelihoods.shape:
+                raise ValueError('Impact and Likelihood matrices need to have the same dimensions.')
+
+        remainders = np.ones((len(likelihoods), self.slots))
+
+        for step in self.steps:
+            step_likelihoods = likelihoods[:, step.rows, step.cols]
+
+            if impacts is None:
+                values = np.where(step.is_target, 1.0, 1 - remainders[:, step.leaves])
+            else:
+                final_impacts = impacts[:, step.rows, step.cols]
+                if np.any((final_impacts == 0) & (step_likelihoods != 0) & step.is_target):
+                    raise ValueError('Unexpected empty DSM cell. The final impact cell was null. '
+                                     'Check if DSMs are valid.')
+                values = np.where(step.is_target, final_impacts, 1 - remainders[:, step.leaves])
+
+            remainders[:, step.parents] *= 1 - step_likelihoods * values
+
+        result = (1 - remainders[:, self.roots]).reshape((len(likelihoods),) + self.shape)
+
+        return result[0] if single else result
+
+    def gradient(self, likelihood: np.ndarray, impact: np.ndarray, weights: Optional[np.ndarray] = None) \
+            -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Calculate the risk of a single scenario, and its derivatives with respect to every DSM cell.
+        The derivatives are computed exactly, in one backward pass over the plan.
+        :param likelihood: Likelihood matrix, oriented like the DSM input
+        :param impact: Impact matrix, oriented like the DSM input
+        :param weights: Weight of each risk value, shaped like the result. The derivatives are those of the
+        weighted sum of the risk values. Defaults to 1 for every value.
+        :return: Risk, shaped like the result, and the derivatives with respect to the likelihood
+        and impact cells, shaped like the input matrices
+        """
+        likelihood = np.asarray(likelihood, dtype=np.float64)
+        if likelihood.ndim != 2:
+            raise ValueError('Gradients are calculated for a single scenario at a time.')
+        likelihood = self._validate_batch(likelihood)[0]
+        impact = np.asarray(impact, dtype=np.float64)
+        if impact.shape != likelihood.shape:
+            raise ValueError('Impact and Likelihood matrices need to have the same dimensions.')
+
+        remainders = np.ones(self.slots)
+        # Per step: remainders of the parents before the step, and the values of the leaves
+        tape = []
+
+        for step in self.steps:
+            step_likelihoods = likelihood[step.rows, step.cols]
+            final_impacts = impact[step.rows, step.cols]
+            if np.any((final_impacts == 0) & (step_likelihoods != 0) & step.is_target):
+                raise ValueError('Unexpected empty DSM cell. The final impact cell was null. '
+                                 'Check if DSMs are valid.')
+            values = np.where(step.is_target, final_impacts, 1 - remainders[step.leaves])
+
+            tape.append((remainders[step.parents], values, step_likelihoods))
+            remainders[step.parents] *= 1 - step_likelihoods * values
+
+        risk = (1 - remainders[self.roots]).reshape(self.shape)
+
+        # Backward pass. Risk is 1 - remainder of the root.
+        adjoints = np.zeros(self.slots)
+        adjoints[self.roots] = -(np.ones(len(self.roots)) if weights is None
+                                 else np.broadcast_to(np.asarray(weights, dtype=np.float64), self.shape).ravel())
+        likelihood_gradient = np.zeros_like(likelihood)
+        impact_gradient = np.zeros_like(impact)
+
+        for step, (parent_remainders, values, step_likelihoods) in zip(reversed(self.steps), reversed(tape)):
+            parent_adjoints = adjoints[step.parents]
+            factor_adjoints = parent_adjoints * parent_remainders
+            adjoints[step.parents] = parent_adjoints * (1 - step_likelihoods * values)
+
+            np.add.at(likelihood_gradient, (step.rows, step.cols), -factor_adjoints * values)
+            value_adjoints = -factor_adjoints * step_likelihoods
+            np.add.at(impact_gradient, (step.rows[step.is_target], step.cols[step.is_target]),
+                      value_adjoints[step.is_target])
+            # The value of other leaves is 1 - their remainder
+            adjoints[step.leaves[~step.is_target]] -= value_adjoints[~step.is_target]
+
+        return risk, likelihood_gradient, impact_gradient
+
+    def _validate_batch(self, likelihoods: np.ndarray) -> np.ndarray:
+        if likelihoods.ndim == 2:
+            likelihoods = likelihoods[np.newaxis]
+
+        if likelihoods.ndim != 3 or likelihoods.shape[1:] != (self.size, self.size):
+            raise ValueError('Scenario matrices need to have the same dimensions as the compiled DSMs.')
+
+        # New interactions would create paths that are not part of the plan
+        outside = (likelihoods != 0) & ~self.pattern
+        outside[:, np.arange(self.size), np.arange(self.size)] = False
+        if outside.any():
+            raise ValueError('Scenario matrices contain interactions that are not part of the compiled plan.')
+
+        return likelihoods
+
+
+def _pattern(dsm_likelihood: DSM) -> np.ndarray:
+    # Non-empty cells in the orientation of the DSM input
+    matrix = dsm_likelihood.matrix.T if dsm_likelihood.instigator == 'row' else dsm_likelihood.matrix
+    pattern = matrix != 0
+    np.fill_diagonal(pattern, False)
+    return pattern
+
+
+def compile_pair(start_index: int, target_index: int, dsm_impact: DSM, dsm_likelihood: DSM,
+                 search_depth: int = 4) -> PropagationPlan:
+    """
+    Compile the propagation paths between two sub-systems. Indices follow the conventions of
+    `ChangePropagationTree`.
+    :param start_index: Column index for start of propagation
+    :param target_index: Column index for propagation target
+    :param dsm_impact: Impact DSM
+    :param dsm_likelihood: Likelihood DSM
+    :param search_depth: Maximum length of propagation paths
+    :return: Plan that evaluates to the risk of the pair
+    """
+    tree = ChangePropagationTree(start_index, target_index, dsm_impact, dsm_likelihood)
+    tree.propagate(search_depth=search_depth)
+
+    return PropagationPlan([tree], (), dsm_likelihood.instigator, _pattern(dsm_likelihood), search_depth)
+
+
+def compile_risk_matrix(dsm_impact: DSM, dsm_likelihood: DSM, search_depth: int = 4) -> PropagationPlan:
+    """
+    Compile the propagation paths between all sub-systems.
+    :param dsm_impact: Impact DSM
+    :param dsm_likelihood: Likelihood DSM
+    :param search_depth: Maximum length of propagation paths
+    :return: Plan that evaluates to risk matrices laid out like `calculate_risk_matrix()`
+    """
+    validate_dsm_pair(dsm_impact, dsm_likelihood)
+    size = len(dsm_likelihood.columns)
+
+    # Trees are compiled one at a time, so only the plan is kept in memory
+    trees = (ChangePropagationTree(i_index, l_index, dsm_impact=dsm_impact, dsm_likelihood=dsm_likelihood)
+             .propagate(search_depth=search_depth)
+             for l_index in range(size) for i_index in range(size))
+
+    return PropagationPlan(trees, (size, size), dsm_likelihood.instigator, _pattern(dsm_likelihood), search_depth)
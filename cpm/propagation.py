@@ -0,0 +1,362 @@
+from time import perf_counter
+from typing import Optional
+import numpy as np
+from cpm.instrumentation import COUNTERS, active_stats
+from cpm.models import DSM, validate_dsm_pair
+
+# Entries of the lists returned by `SourcePropagation._expand`
+_RISK, _PROB, _DEPTH, _COUNT, _LONGEST, _RISK_UPPER, _PROB_UPPER = range(7)
+
+
+class SourcePropagation:
+    """
+    Propagates change from one instigating sub-system to every other sub-system in a single traversal.
+    Each simple path from the source is walked once, and the risk and probability of every
+    reachable target is accumulated at the same time.
+
+    The numbers are identical to those of a `ChangePropagationTree` built for each (source, target) pair.
+    When `cpm.instrumentation.PropagationStats` are active, every source is recorded as a **propagate_source**
+    call with its counters.
+    """
+
+    def __init__(self, dsm_impact: DSM, dsm_likelihood: DSM, search_depth: int = 4,
+                 epsilon: Optional[float] = None):
+        """
+        Prepare propagation for a pair of DSMs.
+        :param dsm_impact: Impact DSM
+        :param dsm_likelihood: Likelihood DSM
+        :param search_depth: Maximum length of propagation paths
+        :param epsilon: Approximate propagation. Branches where the product of the likelihoods from the
+        source falls below epsilon are not explored. See `propagate_bounds()` for the resulting error.
+        """
+        validate_dsm_pair(dsm_impact, dsm_likelihood)
+        if epsilon is not None and epsilon < 0:
+            raise ValueError('epsilon needs to be a non-negative number.')
+
+        self.dsm_impact: DSM = dsm_impact
+        self.dsm_likelihood: DSM = dsm_likelihood
+        self.search_depth: int = search_depth
+        self.epsilon: Optional[float] = epsilon
+        self.size: int = len(dsm_likelihood.columns)
+
+        indptr = dsm_likelihood.indptr
+        self.neighbours: list[np.ndarray] = [dsm_likelihood.indices[indptr[i]:indptr[i + 1]]
+                                             for i in range(self.size)]
+        self.likelihoods: list[np.ndarray] = [dsm_likelihood.data[indptr[i]:indptr[i + 1]]
+                                              for i in range(self.size)]
+        # Impact of propagating from each node to its neighbours, aligned with the likelihood neighbours
+        self.impacts: list[np.ndarray] = [dsm_impact.matrix[self.neighbours[i], i] for i in range(self.size)]
+
+        # Per-run state, see `propagate`
+        self._position: np.ndarray = np.full(self.size, -1)
+        self._active: np.ndarray = np.zeros(0, dtype=np.intp)
+        self._closest: list[int] = []
+        self._width: int = 0
+        self._path_statistics: bool = False
+        self._depth_sweep: bool = False
+        # Leaves, cycle pruned, depth pruned and target paths, see `cpm.instrumentation`
+        self._counts: list[int] = [0, 0, 0, 0]
+
+    def propagate(self, source_index: int, targets: Optional[np.ndarray] = None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Propagate change from a source to all other sub-systems.
+        :param source_index: Index of the instigating sub-system
+        :param targets: Optional indices of the targets of interest. Other targets are reported as 0, and
+        branches that can not reach any of the targets are not explored.
+        :return: Risk and probability of propagation to every sub-system, indexed by target
+        """
+        results = self._run(source_index, targets)
+
+        return results[_RISK], results[_PROB]
+
+    def propagate_statistics(self, source_index: int, targets: Optional[np.ndarray] = None) \
+            -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Propagate change from a source to all other sub-systems, and count the propagation paths.
+        :param source_index: Index of the instigating sub-system
+        :param targets: Optional indices of the targets of interest, see `propagate()`
+        :return: Risk, probability, number of paths, and length of the longest path to every sub-system
+        """
+        if self.epsilon is not None:
+            raise ValueError('Path statistics are not available for approximate propagation.')
+
+        results = self._run(source_index, targets, path_statistics=True)
+
+        return results[_RISK], results[_PROB], results[_COUNT], results[_LONGEST]
+
+    def propagate_by_depth(self, source_index: int, targets: Optional[np.ndarray] = None) \
+            -> tuple[np.ndarray, np.ndarray]:
+        """
+        Propagate change from a source to all other sub-systems, for every search depth up to `search_depth`.
+        :param source_index: Index of the instigating sub-system
+        :param targets: Optional indices of the targets of interest, see `propagate()`
+        :return: Risk and probability of propagation, shaped (search_depth, N). Row d - 1 holds the values
+        for search depth d.
+        """
+        if self.epsilon is not None:
+            raise ValueError('Values by search depth are not available for approximate propagation.')
+
+        results = self._run(source_index, targets, depth_sweep=True)
+
+        return results[_RISK], results[_PROB]
+
+    def propagate_bounds(self, source_index: int, targets: Optional[np.ndarray] = None) \
+            -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Propagate change from a source to all other sub-systems, and bound the error of approximate propagation.
+        A branch that is not explored contributes nothing to the estimate. For the upper bound, it is assumed
+        to reach every target within its reach with certainty. This requires likelihoods and impacts between
+        0 and 1.
+        :param source_index: Index of the instigating sub-system
+        :param targets: Optional indices of the targets of interest, see `propagate()`
+        :return: Estimated risk and probability, which are lower bounds, followed by the upper bounds of the
+        risk and probability
+        """
+        results = self._run(source_index, targets)
+        if self.epsilon is None:
+            return results[_RISK], results[_PROB], results[_RISK].copy(), results[_PROB].copy()
+
+        return results[_RISK], results[_PROB], results[_RISK_UPPER], results[_PROB_UPPER]
+
+    def _run(self, source_index: int, targets: Optional[np.ndarray], path_statistics: bool = False,
+             depth_sweep: bool = False) -> list:
+        stats = active_stats()
+        if stats is None:
+            return self._traverse(source_index, targets, path_statistics, depth_sweep)
+
+        began = perf_counter()
+        self._counts = [1, 0, 0, 0]
+        results = self._traverse(source_index, targets, path_statistics, depth_sweep)
+        stats.record('propagate_source', perf_counter() - began, source=self.dsm_likelihood.columns[source_index],
+                     **dict(zip(COUNTERS, self._counts)))
+
+        return results
+
+    def _traverse(self, source_index: int, targets: Optional[np.ndarray], path_statistics: bool,
+                  depth_sweep: bool) -> list:
+        shape = (max(self.search_depth, 0), self.size) if depth_sweep else (self.size,)
+        results = [np.zeros(shape), np.zeros(shape), None, np.zeros(self.size, dtype=np.int64),
+                   np.zeros(self.size, dtype=np.int64), np.zeros(self.size), np.zeros(self.size)]
+
+        # Only targets within reach of the source are evaluated
+        reachable = self.dsm_likelihood.distances_from(source_index, self.search_depth) <= self.search_depth
+        reachable[source_index] = False
+        if targets is not None:
+            reachable &= np.isin(np.arange(self.size), targets)
+
+        active = np.flatnonzero(reachable)
+        if len(active) == 0 or self.search_depth < 1:
+            return results
+
+        self._width = len(active)
+        self._active = active
+        self._position = np.full(self.size, -1)
+        self._position[active] = np.arange(self._width)
+        self._path_statistics = path_statistics
+        self._depth_sweep = depth_sweep
+
+        indptr, indices = self.dsm_likelihood.reverse_adjacency
+        self._closest = _closest_other_target(indptr, indices, active, self.search_depth).tolist()
+
+        values = self._expand(source_index, 1 << source_index, self.search_depth, 1.0)
+        results[_RISK][..., active] = values[_RISK]
+        results[_PROB][..., active] = values[_PROB]
+        if path_statistics:
+            results[_COUNT][active] = values[_COUNT]
+            results[_LONGEST][active] = np.maximum(values[_LONGEST], 0)
+        if self.epsilon is not None:
+            for measure, exact in [(_RISK_UPPER, _RISK), (_PROB_UPPER, _PROB)]:
+                upper = values[measure] if values[measure] is not None else values[exact]
+                results[measure][active] = upper
+
+        return results
+
+    def _empty(self, remaining: int) -> list:
+        width = self._width
+        # With a depth sweep, risk and probability hold one row for every remaining depth 1..remaining
+        shape = (remaining, width) if self._depth_sweep else (width,)
+        # Upper bounds are None as long as they equal the exact values
+        values = [np.zeros(shape), np.zeros(shape), np.full(width, np.inf), None, None, None, None]
+        if self._path_statistics:
+            values[_COUNT] = np.zeros(width)
+            values[_LONGEST] = np.full(width, -np.inf)
+        return values
+
+    def _expand(self, node: int, visited: int, remaining: int, mass: float) -> list:
+        """
+        Evaluate all simple paths leaving a node.
+        Entry t of the returned vectors holds the values of a propagation tree rooted in the node
+        with active target t as its target: risk, probability, length of the shortest path, and
+        optionally the number of paths, the length of the longest path and the upper bounds of risk and
+        probability. The shortest path determines the order in which a `ChangePropagationTree` combines
+        its branches.
+        :param mass: Product of the likelihoods on the path from the source to the node
+        """
+        neighbours = self.neighbours[node]
+        likelihoods = self.likelihoods[node]
+        impacts = self.impacts[node]
+        approximate = self.epsilon is not None
+
+        open_branches = [k for k, neighbour in enumerate(neighbours.tolist()) if not visited >> neighbour & 1]
+        counts = self._counts
+        counts[1] += len(neighbours) - len(open_branches)
+
+        if not open_branches:
+            return self._empty(remaining)
+
+        if len(open_branches) < len(neighbours):
+            neighbours = neighbours[open_branches]
+            likelihoods = likelihoods[open_branches]
+            impacts = impacts[open_branches]
+
+        positions = self._position[neighbours]
+
+        if np.any(impacts[positions >= 0] == 0):
+            raise ValueError('Unexpected empty DSM cell. The final impact cell was null. Check if DSMs are valid.')
+
+        if remaining == 1:
+            # Every branch ends in its own target, so each target gets a single factor
+            values = self._empty(remaining)
+            ends = positions >= 0
+            positions = positions[ends]
+            counts[0] += len(positions)
+            counts[2] += len(ends) - len(positions)
+            counts[3] += len(positions)
+            values[_RISK][..., positions] = 1 - (1 - likelihoods[ends] * impacts[ends])
+            values[_PROB][..., positions] = 1 - (1 - likelihoods[ends])
+            values[_DEPTH][positions] = 1
+            if self._path_statistics:
+                values[_COUNT][positions] = 1
+                values[_LONGEST][positions] = 1
+            return values
+
+        branches = []
+
+        for neighbour, position, likelihood, impact in zip(neighbours.tolist(), positions.tolist(),
+                                                           likelihoods.tolist(), impacts.tolist()):
+            explore = self._closest[neighbour] <= remaining - 1
+            if explore and approximate and mass * likelihood < self.epsilon:
+                # Not explored. Every target the branch can reach may be reached with certainty.
+                branch = self._empty(remaining)
+                distances = self.dsm_likelihood.distances_from(neighbour, remaining - 1)[self._active]
+                reach = distances <= remaining - 1
+                branch[_RISK_UPPER] = reach.astype(np.float64)
+                branch[_PROB_UPPER] = reach.astype(np.float64)
+                branch[_DEPTH][reach] = distances[reach] + 1
+            elif explore:
+                branch = self._expand(neighbour, visited | 1 << neighbour, remaining - 1, mass * likelihood)
+                branch[_DEPTH] += 1
+                if self._path_statistics:
+                    branch[_LONGEST] += 1
+                if self._depth_sweep:
+                    # The branch contributes nothing if only one interaction remains
+                    branch[_RISK] = np.vstack([np.zeros(self._width), branch[_RISK]])
+                    branch[_PROB] = np.vstack([np.zeros(self._width), branch[_PROB]])
+            elif position >= 0:
+                branch = self._empty(remaining)
+            else:
+                # No active target can be reached through this branch
+                counts[2] += 1
+                continue
+
+            counts[0] += 1
+            if position >= 0:
+                # Propagation towards the neighbour itself ends in the neighbour
+                counts[3] += 1
+                branch[_RISK][..., position] = impact
+                branch[_PROB][..., position] = 1
+                branch[_DEPTH][position] = 1
+                if self._path_statistics:
+                    branch[_COUNT][position] = 1
+                    branch[_LONGEST][position] = 1
+                if branch[_RISK_UPPER] is not None:
+                    branch[_RISK_UPPER][position] = impact
+                    branch[_PROB_UPPER][position] = 1
+
+            for measure in [_RISK, _PROB, _RISK_UPPER, _PROB_UPPER]:
+                if branch[measure] is not None:
+                    branch[measure] = 1 - likelihood * branch[measure]
+            branches.append(branch)
+
+        if not branches:
+            return self._empty(remaining)
+
+        if len(branches) == 1:
+            values = branches[0]
+            for measure in [_RISK, _PROB, _RISK_UPPER, _PROB_UPPER]:
+                if values[measure] is not None:
+                    values[measure] = 1 - values[measure]
+            return values
+
+        values = [None] * 7
+
+        # Branches are combined in the order a breadth-first search first reaches the target through them
+        depths = np.array([branch[_DEPTH] for branch in branches])
+        order = np.argsort(depths, axis=0, kind='stable')
+        values[_DEPTH] = depths.min(axis=0)
+        if self._depth_sweep:
+            order = np.broadcast_to(order[:, np.newaxis], (len(branches), remaining, self._width))
+
+        for measure in [_RISK, _PROB]:
+            factors = np.array([branch[measure] for branch in branches])
+            values[measure] = 1 - np.prod(np.take_along_axis(factors, order, axis=0), axis=0)
+
+        if self._path_statistics:
+            values[_COUNT] = np.sum([branch[_COUNT] for branch in branches], axis=0)
+            values[_LONGEST] = np.max([branch[_LONGEST] for branch in branches], axis=0)
+
+        if approximate and any(branch[_RISK_UPPER] is not None for branch in branches):
+            for measure, exact in [(_RISK_UPPER, _RISK), (_PROB_UPPER, _PROB)]:
+                factors = np.array([branch[measure] if branch[measure] is not None else branch[exact]
+                                    for branch in branches])
+                values[measure] = 1 - np.prod(np.take_along_axis(factors, order, axis=0), axis=0)
+
+        return values
+
+
+def _closest_other_target(indptr: np.ndarray, indices: np.ndarray, targets: np.ndarray, max_depth: int) \
+        -> np.ndarray:
+    """
+    Hop distance from every node to the closest target other than itself, up to `max_depth`. Other nodes
+    get `max_depth + 1`. The search runs backwards from every target at once, over the CSR index of the
+    interactions by receiver, and keeps the two closest targets of every node.
+    """
+    size = len(indptr) - 1
+    closest = np.full(size, max_depth + 1, dtype=np.int32)
+    # Closest target of every node, and the number of targets that reached it
+    first = np.full(size, -1, dtype=np.intp)
+    labels = np.zeros(size, dtype=np.int8)
+
+    nodes = np.asarray(targets, dtype=np.intp)
+    origins = nodes
+    first[nodes] = nodes
+    labels[nodes] = 1
+
+    for hop in range(1, max_depth + 1):
+        begins = indptr[nodes]
+        counts = indptr[nodes + 1] - begins
+        total = int(counts.sum())
+        if total == 0:
+            break
+        positions = np.repeat(begins - np.cumsum(counts) + counts, counts) + np.arange(total)
+
+        reached = indices[positions]
+        origins = np.repeat(origins, counts)
+        new = (labels[reached] < 2) & (first[reached] != origins)
+        if not new.any():
+            break
+
+        # Each (node, target) pair once, grouped by node
+        nodes, origins = np.divmod(np.unique(reached[new] * size + origins[new]), size)
+        groups = np.flatnonzero(np.r_[True, nodes[1:] != nodes[:-1]])
+        rank = np.arange(len(nodes)) - np.repeat(groups, np.diff(np.r_[groups, len(nodes)]))
+        kept = rank < 2 - labels[nodes]
+        nodes, origins, rank = nodes[kept], origins[kept], rank[kept]
+
+        starting = (labels[nodes] == 0) & (rank == 0)
+        first[nodes[starting]] = origins[starting]
+        np.add.at(labels, nodes, 1)
+        # Targets never reach themselves again, so every new label is another target
+        closest[nodes] = np.minimum(closest[nodes], hop)
+
+    return closest
@@ -0,0 +1,109 @@
+from typing import Optional
+import numpy as np
+from cpm.models import DSM, validate_dsm_pair
+from cpm.propagation import SourcePropagation
+
+
+class RiskBounds:
+    """
+    Lower and upper bounds of the risk and likelihood matrices.
+    Matrices are laid out like the result of `calculate_risk_matrix()`.
+    """
+
+    def __init__(self, risk_lower: np.ndarray, risk_upper: np.ndarray, likelihood_lower: np.ndarray,
+                 likelihood_upper: np.ndarray, refined: np.ndarray):
+        """
+        :param risk_lower: Lower bounds of the risk
+        :param risk_upper: Upper bounds of the risk
+        :param likelihood_lower: Lower bounds of the combined likelihood
+        :param likelihood_upper: Upper bounds of the combined likelihood
+        :param refined: True for the pairs that were calculated exactly, where the bounds are equal
+        """
+        self.risk_lower: np.ndarray = risk_lower
+        self.risk_upper: np.ndarray = risk_upper
+        self.likelihood_lower: np.ndarray = likelihood_lower
+        self.likelihood_upper: np.ndarray = likelihood_upper
+        self.refined: np.ndarray = refined
+
+    def candidates(self, threshold: float) -> list[tuple[int, int]]:
+        """
+        Find the pairs whose risk may reach a threshold.
+        :param threshold: Smallest risk of interest
+        :return: (row, column) cells of the pairs
+        """
+        rows, columns = np.nonzero(self.risk_upper >= threshold)
+        return list(zip(rows.tolist(), columns.tolist()))
+
+
+def screen_risk_matrix(dsm_impact: DSM, dsm_likelihood: DSM, search_depth: int = 4,
+                       threshold: Optional[float] = None) -> RiskBounds:
+    """
+    Bound the risk and likelihood of change propagation between all sub-systems using matrix products.
+
+    The upper bounds sum the likelihoods of all walks of at most `search_depth` interactions, which include
+    every simple path that `calculate_risk_matrix()` enumerates. The lower bounds are the best path of one or
+    two interactions. Both hold for likelihoods and impacts between 0 and 1.
+    :param dsm_impact: Impact DSM
+    :param dsm_likelihood: Likelihood DSM
+    :param search_depth: Maximum length of propagation paths
+    :param threshold: If set, pairs with an upper risk bound of at least `threshold` are calculated exactly
+    :return: Bounds of the risk and likelihood matrices
+    """
+    validate_dsm_pair(dsm_impact, dsm_likelihood)
+
+    # Source-major: likelihoods[u, v] is the likelihood of change propagating from u to v
+    likelihoods = np.array(dsm_likelihood.matrix.T, dtype=float)
+    np.fill_diagonal(likelihoods, 0)
+    final = likelihoods * dsm_impact.matrix.T
+    if likelihoods.min() < 0 or likelihoods.max() > 1 or final.min() < 0 or final.max() > 1:
+        raise ValueError('Likelihoods and impacts need to be between 0 and 1 to be screened.')
+
+    size = len(likelihoods)
+    risk_upper = np.zeros((size, size))
+    likelihood_upper = np.zeros((size, size))
+    risk_lower = np.zeros((size, size))
+    likelihood_lower = np.zeros((size, size))
+
+    if search_depth >= 1:
+        # Sum over walk lengths k of L^(k-1) L, and L^(k-1) (L * I) for the risk
+        walks = np.eye(size)
+        for _ in range(search_depth):
+            risk_upper += walks @ final
+            walks = walks @ likelihoods
+            likelihood_upper += walks
+
+        risk_lower = final.copy()
+        likelihood_lower = likelihoods.copy()
+
+    if search_depth >= 2:
+        # Best path through a single intermediate sub-system
+        for node in np.flatnonzero(likelihoods.any(axis=0) & likelihoods.any(axis=1)).tolist():
+            sources = np.flatnonzero(likelihoods[:, node])
+            targets = np.flatnonzero(likelihoods[node])
+            cells = np.ix_(sources, targets)
+            risk_lower[cells] = np.maximum(risk_lower[cells], np.outer(likelihoods[sources, node], final[node, targets]))
+            likelihood_lower[cells] = np.maximum(likelihood_lower[cells],
+                                                 np.outer(likelihoods[sources, node], likelihoods[node, targets]))
+
+    # The final impact is at most 1, so the risk is at most the likelihood
+    np.clip(likelihood_upper, 0, 1, out=likelihood_upper)
+    np.minimum(risk_upper, likelihood_upper, out=risk_upper)
+    for matrix in [risk_upper, likelihood_upper, risk_lower, likelihood_lower]:
+        np.fill_diagonal(matrix, 0)
+
+    refined = np.zeros((size, size), dtype=bool)
+    if threshold is not None:
+        propagation = SourcePropagation(dsm_impact, dsm_likelihood, search_depth=search_depth)
+        for source in range(size):
+            targets = np.flatnonzero((risk_upper[source] >= threshold) & (risk_upper[source] > 0))
+            if len(targets) == 0:
+                continue
+
+            risk, prob = propagation.propagate(source, targets=targets)
+            risk_lower[source, targets] = risk_upper[source, targets] = risk[targets]
+            likelihood_lower[source, targets] = likelihood_upper[source, targets] = prob[targets]
+            refined[source, targets] = True
+
+    if dsm_likelihood.instigator == 'column':
+        return RiskBounds(risk_lower.T, risk_upper.T, likelihood_lower.T, likelihood_upper.T, refined.T)
+    return RiskBounds(risk_lower, risk_upper, likelihood_lower, likelihood_upper, refined)
@@ -0,0 +1,64 @@
+from typing import Optional
+import numpy as np
+from cpm.models import DSM
+from cpm.plans import PropagationPlan, compile_risk_matrix
+
+
+class RiskSensitivity:
+    """
+    Derivatives of a weighted sum of risk values with respect to every likelihood and impact cell.
+    Cells are indexed by row and column, as in the DSM input.
+    """
+
+    def __init__(self, risk: np.ndarray, likelihood_gradient: np.ndarray, impact_gradient: np.ndarray):
+        """
+        :param risk: Risk matrix, laid out like the result of `calculate_risk_matrix()`
+        :param likelihood_gradient: Derivative of the weighted risk with respect to each likelihood cell
+        :param impact_gradient: Derivative of the weighted risk with respect to each impact cell
+        """
+        self.risk: np.ndarray = risk
+        self.likelihood_gradient: np.ndarray = likelihood_gradient
+        self.impact_gradient: np.ndarray = impact_gradient
+
+    def top(self, k: int = 10, of: str = 'likelihood') -> list[tuple[int, int, float]]:
+        """
+        Get the cells with the largest derivatives.
+        :param k: Number of cells
+        :param of: **likelihood** or **impact**
+        :return: Row, column and derivative of each cell, largest derivative first
+        """
+        if of not in ['likelihood', 'impact']:
+            raise ValueError('of argument needs to be either "likelihood" or "impact".')
+
+        gradient = self.likelihood_gradient if of == 'likelihood' else self.impact_gradient
+        cells = np.flatnonzero(gradient)
+        cells = cells[np.argsort(-gradient.ravel()[cells], kind='stable')][:k]
+        rows, columns = np.unravel_index(cells, gradient.shape)
+
+        return [(int(row), int(column), float(gradient[row, column])) for row, column in zip(rows, columns)]
+
+
+def risk_sensitivity(dsm_impact: DSM, dsm_likelihood: DSM, search_depth: int = 4,
+                     weights: Optional[np.ndarray] = None, plan: Optional[PropagationPlan] = None) \
+        -> RiskSensitivity:
+    """
+    Calculate the risk matrix, and how it changes with each likelihood and impact cell.
+    The derivatives are exact, and are accumulated in a single backward pass over the propagation paths.
+    :param dsm_impact: Impact DSM
+    :param dsm_likelihood: Likelihood DSM
+    :param search_depth: Maximum length of propagation paths
+    :param weights: Weight of each risk value, laid out like the risk matrix. By default, the derivatives
+    are those of the sum of all risk values. Set a single weight to 1 to get the derivatives of one risk value.
+    :param plan: Plan from `compile_risk_matrix()` for these DSMs, to reuse between calls
+    :return: Risk and derivatives
+    """
+    if plan is None:
+        plan = compile_risk_matrix(dsm_impact, dsm_likelihood, search_depth=search_depth)
+
+    likelihood = dsm_likelihood.matrix.T if dsm_likelihood.instigator == 'row' else dsm_likelihood.matrix
+    impact = dsm_impact.matrix.T if dsm_impact.instigator == 'row' else dsm_impact.matrix
+
+    # Diagonal cells hold labels, not interactions
+    likelihood = np.where(plan.pattern, likelihood, 0)
+
+    return RiskSensitivity(*plan.gradient(likelihood, impact, weights))
@@ -0,0 +1,86 @@
+from threading import Lock
+from typing import Optional
+from cpm.memo import PropagationCache
+from cpm.models import DSM, ChangePropagationTree, validate_dsm_pair
+
+
+class AnalysisSession:
+    """
+    Answers single pair queries against one impact and likelihood DSM pair.
+    The DSMs are validated once, and computed risks and likelihoods are kept in a cache that evicts the least
+    recently used pairs. A session can be shared across threads.
+
+    Indices follow the conventions of `ChangePropagationTree`, and the values are identical to those of a tree.
+    The DSMs should not be changed while the session is in use, or the cache needs to be cleared with `clear()`.
+    """
+
+    def __init__(self, dsm_impact: DSM, dsm_likelihood: DSM, max_entries: Optional[int] = 4096):
+        """
+        :param dsm_impact: Impact DSM
+        :param dsm_likelihood: Likelihood DSM
+        :param max_entries: Maximum number of cached (start, target, search depth) results. None is unbounded.
+        """
+        validate_dsm_pair(dsm_impact, dsm_likelihood)
+
+        self.dsm_impact: DSM = dsm_impact
+        self.dsm_likelihood: DSM = dsm_likelihood
+        self.cache: PropagationCache = PropagationCache(max_entries)
+        self._lock: Lock = Lock()
+        self._size: int = len(dsm_likelihood.columns)
+        self._swap: bool = dsm_likelihood.instigator == 'row'
+
+        # Building the node network is not thread-safe, so it is done up front. Hop distances are searched
+        # under the lock.
+        _ = dsm_impact.node_network
+
+    def risk(self, start_index: int, target_index: int, search_depth: int = 4) -> float:
+        """
+        Get the risk of change propagating from one sub-system to another.
+        :param start_index: Column index for start of propagation
+        :param target_index: Column index for propagation target
+        :param search_depth: Maximum length of propagation paths
+        :return: Risk
+        """
+        return self._values(start_index, target_index, search_depth)[0]
+
+    def likelihood(self, start_index: int, target_index: int, search_depth: int = 4) -> float:
+        """
+        Get the probability/likelihood of change propagating from one sub-system to another.
+        :param start_index: Column index for start of propagation
+        :param target_index: Column index for propagation target
+        :param search_depth: Maximum length of propagation paths
+        :return: Probability
+        """
+        return self._values(start_index, target_index, search_depth)[1]
+
+    def clear(self):
+        """
+        Clear the cached results.
+        """
+        with self._lock:
+            self.cache.clear()
+
+    def _values(self, start_index: int, target_index: int, search_depth: int) -> tuple[float, float]:
+        if not (0 <= start_index < self._size and 0 <= target_index < self._size):
+            raise ValueError('Index is outside of the DSM.')
+
+        key = (start_index, target_index, search_depth)
+        with self._lock:
+            values = self.cache.get(key)
+        if values is not None:
+            return values
+
+        if self._swap:
+            start_index, target_index = target_index, start_index
+
+        # Concurrent queries for the same pair may both compute it. The results are identical.
+        with self._lock:
+            self.dsm_likelihood.distances_to(target_index, search_depth)
+        tree = ChangePropagationTree._unchecked(start_index, target_index, self.dsm_impact, self.dsm_likelihood)
+        tree.propagate(search_depth=search_depth)
+        values = (tree.get_risk(), tree.get_probability())
+
+        with self._lock:
+            self.cache.put(key, values)
+
+        return values
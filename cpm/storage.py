@@ -0,0 +1,167 @@
+from typing import Optional
+import json
+import struct
+import numpy as np
+from cpm.models import DSM
+
+# File layout:
+#   8 bytes magic, 8 bytes header length (little endian), JSON header padded with spaces, raw data.
+#   The data is C-ordered (row by row), unless the header has "order": "F" (column by column).
+# The data starts at a multiple of _ALIGNMENT, so it can be memory-mapped directly.
+_MAGIC = b'CPMLIB\x00\x01'
+_ALIGNMENT = 64
+_DTYPES = ['<f8', '<f4']
+
+
+def save_matrix(path: str, matrix: np.ndarray, columns: Optional[list[str]] = None, kind: str = 'matrix',
+                metadata: Optional[dict] = None):
+    """
+    Save a matrix in the binary matrix format.
+    :param path: Target file
+    :param matrix: Two-dimensional float64 or float32 matrix
+    :param columns: Matrix header
+    :param kind: Type of matrix, e.g. **dsm** or **risk**
+    :param metadata: JSON serializable metadata
+    """
+    matrix = np.asarray(matrix)
+    if matrix.dtype not in (np.float64, np.float32):
+        matrix = matrix.astype(np.float64)
+    dtype = matrix.dtype.newbyteorder('<')
+
+    with open(path, 'wb') as f:
+        _write_header(f, dtype, matrix.shape, columns, kind, metadata)
+        matrix.astype(dtype, copy=False).tofile(f)
+
+
+def create_matrix(path: str, shape: tuple[int, int], dtype=np.float64, columns: Optional[list[str]] = None,
+                  kind: str = 'matrix', metadata: Optional[dict] = None, order: str = 'C') -> np.memmap:
+    """
+    Create a zero-filled matrix file in the binary matrix format, and memory-map it for writing.
+    This allows matrices that do not fit in memory to be written piece by piece.
+    :param path: Target file
+    :param shape: Shape of the matrix
+    :param dtype: float64 or float32
+    :param columns: Matrix header
+    :param kind: Type of matrix, e.g. **dsm** or **risk**
+    :param metadata: JSON serializable metadata
+    :param order: **C** stores the matrix row by row, and **F** column by column. Writes are fastest when
+    they follow the order. The order is recorded in the file, and `load_matrix()` follows it.
+    :return: Writable memory-mapped matrix. Flush it, or delete it, when done.
+    """
+    if order not in ['C', 'F']:
+        raise ValueError('order argument needs to be either "C" or "F".')
+    dtype = np.dtype(dtype).newbyteorder('<')
+    if dtype.str not in _DTYPES:
+        raise ValueError(f'Unsupported matrix data type {dtype}.')
+
+    with open(path, 'wb') as f:
+        offset = _write_header(f, dtype, shape, columns, kind, metadata, order)
+        f.truncate(offset + int(np.prod(shape)) * dtype.itemsize)
+
+    return np.memmap(path, dtype=dtype, mode='r+', offset=offset, shape=tuple(shape), order=order)
+
+
+def _write_header(f, dtype: np.dtype, shape: tuple[int, ...], columns: Optional[list[str]], kind: str,
+                  metadata: Optional[dict], order: str = 'C') -> int:
+    fields = {
+        'kind': kind,
+        'dtype': dtype.str,
+        'shape': list(shape),
+        'columns': list(columns) if columns is not None else None,
+        'metadata': metadata or {},
+    }
+    if order != 'C':
+        fields['order'] = order
+    header = json.dumps(fields).encode('utf-8')
+
+    offset = len(_MAGIC) + 8 + len(header)
+    padding = -offset % _ALIGNMENT
+
+    f.write(_MAGIC)
+    f.write(struct.pack('<Q', len(header) + padding))
+    f.write(header)
+    f.write(b' ' * padding)
+
+    return offset + padding
+
+
+def load_matrix(path: str, mmap: bool = True) -> tuple[np.ndarray, dict]:
+    """
+    Load a matrix saved with `save_matrix()` or `create_matrix()`.
+    :param path: Source file
+    :param mmap: Memory-map the matrix data read-only instead of reading it into memory
+    :return: The matrix, and the file header with the keys kind, columns and metadata
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(_MAGIC)) != _MAGIC:
+            raise ValueError(f'{path} is not a cpm-lib matrix file.')
+        header_length, = struct.unpack('<Q', f.read(8))
+        header = json.loads(f.read(header_length).decode('utf-8'))
+        offset = f.tell()
+
+        if header['dtype'] not in _DTYPES:
+            raise ValueError(f'Unsupported matrix data type {header["dtype"]}.')
+
+        dtype = np.dtype(header['dtype'])
+        shape = tuple(header['shape'])
+        order = header.get('order', 'C')
+
+        if not mmap or 0 in shape:
+            matrix = np.fromfile(f, dtype=dtype, count=int(np.prod(shape))).reshape(shape, order=order)
+        else:
+            matrix = np.memmap(f, dtype=dtype, mode='r', offset=offset, shape=shape, order=order)
+
+    return matrix, header
+
+
+def save_dsm(dsm: DSM, path: str, metadata: Optional[dict] = None):
+    """
+    Save a DSM in the binary matrix format.
+    The matrix is stored as it was provided, i.e. not transposed for row instigators.
+    :param dsm: DSM to save
+    :param path: Target file
+    :param metadata: JSON serializable metadata
+    """
+    matrix = dsm.matrix.T if dsm.instigator == 'row' else dsm.matrix
+    metadata = dict(metadata or {}, instigator=dsm.instigator)
+
+    save_matrix(path, matrix, columns=dsm.columns, kind='dsm', metadata=metadata)
+
+
+def load_dsm(path: str, mmap: bool = True) -> DSM:
+    """
+    Load a DSM saved with `save_dsm()`. With `mmap`, the DSM matrix is backed by the file and is not copied.
+    :param path: Source file
+    :param mmap: Memory-map the matrix data
+    :return: DSM
+    """
+    matrix, header = load_matrix(path, mmap=mmap)
+    if header['kind'] != 'dsm':
+        raise ValueError(f'{path} does not contain a DSM.')
+
+    return DSM(matrix, header['columns'], instigator=header['metadata'].get('instigator', 'column'))
+
+
+def save_risk_matrix(path: str, matrix, columns: list[str], metadata: Optional[dict] = None):
+    """
+    Save a risk matrix, e.g. from `calculate_risk_matrix()`, in the binary matrix format.
+    :param path: Target file
+    :param matrix: Risk matrix as nested lists or an array
+    :param columns: Matrix header
+    :param metadata: JSON serializable metadata, such as the search depth
+    """
+    save_matrix(path, np.asarray(matrix, dtype=np.float64), columns=columns, kind='risk', metadata=metadata)
+
+
+def load_risk_matrix(path: str, mmap: bool = True) -> tuple[np.ndarray, list[str], dict]:
+    """
+    Load a risk matrix saved with `save_risk_matrix()`.
+    :param path: Source file
+    :param mmap: Memory-map the matrix data read-only
+    :return: The risk matrix, its header and the metadata
+    """
+    matrix, header = load_matrix(path, mmap=mmap)
+    if header['kind'] != 'risk':
+        raise ValueError(f'{path} does not contain a risk matrix.')
+
+    return matrix, header['columns'], header['metadata']
@@ -0,0 +1,170 @@
+from concurrent.futures import Executor
+from typing import Iterator, Optional
+import os
+import tempfile
+import numpy as np
+from cpm.models import DSM, validate_dsm_pair
+from cpm.parallel import iter_source_chunks
+from cpm.propagation import SourcePropagation
+from cpm.storage import create_matrix
+
+# Size of the blocks of rows that `write_risk_csv()` reads back from its temporary file
+_CSV_BLOCK_BYTES = 1 << 24
+
+
+def iter_risk_matrix(dsm_impact: DSM, dsm_likelihood: DSM, search_depth: int = 4, likelihood: bool = False,
+                     workers: Optional[int] = None, executor: Optional[Executor] = None) \
+        -> Iterator[tuple[int, np.ndarray]]:
+    """
+    Propagate change from every sub-system, yielding the results of each instigator as soon as they are
+    calculated. Only the results of one chunk of instigators are held in memory at a time.
+    :param dsm_impact: Impact DSM
+    :param dsm_likelihood: Likelihood DSM
+    :param search_depth: Maximum length of propagation paths
+    :param likelihood: Yield the combined likelihood instead of the risk
+    :param workers: Number of worker processes. By default, the instigators are propagated in the current process.
+    :param executor: Executor used to run chunks of instigators in parallel, see `calculate_risk_matrix()`
+    :return: Iterator of an instigator index, and the values from it to every sub-system. For row instigators
+    these are the rows of `calculate_risk_matrix()`, and for column instigators its columns. With workers,
+    instigators are yielded in the order their chunks complete.
+    """
+    measure = 1 if likelihood else 0
+
+    if (workers is not None and workers > 1) or executor is not None:
+        for sources, blocks in iter_source_chunks(dsm_impact, dsm_likelihood, search_depth=search_depth,
+                                                  workers=workers, executor=executor):
+            for row, source_index in enumerate(sources):
+                yield source_index, blocks[measure, row]
+    else:
+        propagation = SourcePropagation(dsm_impact, dsm_likelihood, search_depth=search_depth)
+        for source_index in range(propagation.size):
+            yield source_index, propagation.propagate(source_index)[measure]
+
+
+def write_risk_memmap(path: str, dsm_impact: DSM, dsm_likelihood: DSM, search_depth: int = 4,
+                      dtype=np.float32, likelihood: bool = False, workers: Optional[int] = None,
+                      executor: Optional[Executor] = None) -> np.memmap:
+    """
+    Write the risk matrix to a memory-mapped file in the binary matrix format, without holding it in memory.
+    The file can be loaded with `cpm.storage.load_risk_matrix()`. The values from each instigator are stored
+    contiguously, so for column instigators the file is stored column by column.
+    :param path: Target file
+    :param dsm_impact: Impact DSM
+    :param dsm_likelihood: Likelihood DSM
+    :param search_depth: Maximum length of propagation paths
+    :param dtype: float32 or float64
+    :param likelihood: Write the combined likelihood instead of the risk
+    :param workers: Number of worker processes, see `iter_risk_matrix()`
+    :param executor: Executor used to run chunks of instigators in parallel
+    :return: The written matrix, laid out like the result of `calculate_risk_matrix()`
+    """
+    validate_dsm_pair(dsm_impact, dsm_likelihood)
+
+    size = len(dsm_likelihood.columns)
+    metadata = {'search_depth': search_depth, 'measure': 'likelihood' if likelihood else 'risk'}
+    order = 'F' if dsm_impact.instigator == 'column' else 'C'
+    matrix = create_matrix(path, (size, size), dtype=dtype, columns=dsm_likelihood.columns, kind='risk',
+                           metadata=metadata, order=order)
+
+    for index, values in iter_risk_matrix(dsm_impact, dsm_likelihood, search_depth, likelihood, workers, executor):
+        if dsm_impact.instigator == 'column':
+            matrix[:, index] = values
+        else:
+            matrix[index] = values
+
+    matrix.flush()
+    return matrix
+
+
+def write_risk_csv(path: str, dsm_impact: DSM, dsm_likelihood: DSM, search_depth: int = 4,
+                   delimiter: str = ';', likelihood: bool = False, workers: Optional[int] = None,
+                   executor: Optional[Executor] = None):
+    """
+    Write the risk matrix to a CSV file, in the layout of the input CSV files, one row at a time.
+    For column instigators, a row holds the values from every instigator, so the matrix is first written to a
+    temporary memory-mapped file next to the CSV file, which is read back in blocks of rows.
+    :param path: Target file
+    :param dsm_impact: Impact DSM
+    :param dsm_likelihood: Likelihood DSM
+    :param search_depth: Maximum length of propagation paths
+    :param delimiter: CSV delimiter
+    :param likelihood: Write the combined likelihood instead of the risk
+    :param workers: Number of worker processes, see `iter_risk_matrix()`
+    :param executor: Executor used to run chunks of instigators in parallel
+    """
+    validate_dsm_pair(dsm_impact, dsm_likelihood)
+    columns = dsm_likelihood.columns
+
+    with open(path, 'w', newline='') as file:
+        file.write(delimiter.join([''] + list(columns)) + '\n')
+
+        if dsm_impact.instigator == 'row':
+            # Rows are written in order, so results that complete out of order wait for their turn
+            pending = {}
+            next_row = 0
+            for index, values in iter_risk_matrix(dsm_impact, dsm_likelihood, search_depth, likelihood, workers,
+                                                  executor):
+                pending[index] = values
+                while next_row in pending:
+                    _write_row(file, columns[next_row], pending.pop(next_row), delimiter)
+                    next_row += 1
+            return
+
+        handle, temporary = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+        os.close(handle)
+        try:
+            matrix = write_risk_memmap(temporary, dsm_impact, dsm_likelihood, search_depth, np.float64,
+                                       likelihood, workers, executor)
+            # The file is stored column by column, so a block of rows is read as one piece of every column
+            block_rows = max(1, _CSV_BLOCK_BYTES // (8 * len(columns)))
+            for start in range(0, len(columns), block_rows):
+                block = np.array(matrix[start:start + block_rows])
+                for offset, values in enumerate(block):
+                    _write_row(file, columns[start + offset], values, delimiter)
+            del matrix
+        finally:
+            os.remove(temporary)
+
+
+def _write_row(file, name: str, values: np.ndarray, delimiter: str):
+    file.write(delimiter.join([name] + [repr(value) for value in values.tolist()]) + '\n')
+
+
+def risk_matrix_coo(dsm_impact: DSM, dsm_likelihood: DSM, search_depth: int = 4, threshold: float = 0.0,
+                    likelihood: bool = False, workers: Optional[int] = None, executor: Optional[Executor] = None) \
+        -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Calculate the risk matrix in sparse coordinate (COO) form, keeping only the risks above a threshold.
+    Memory use is proportional to the number of kept cells.
+    :param dsm_impact: Impact DSM
+    :param dsm_likelihood: Likelihood DSM
+    :param search_depth: Maximum length of propagation paths
+    :param threshold: Cells with a value of at most `threshold` are left out
+    :param likelihood: Keep the combined likelihood instead of the risk
+    :param workers: Number of worker processes, see `iter_risk_matrix()`
+    :param executor: Executor used to run chunks of instigators in parallel
+    :return: Rows, columns and values of the kept cells, laid out like the result of `calculate_risk_matrix()`.
+    They are sorted by row and column.
+    """
+    validate_dsm_pair(dsm_impact, dsm_likelihood)
+
+    instigators = []
+    receivers = []
+    values = []
+    for index, vector in iter_risk_matrix(dsm_impact, dsm_likelihood, search_depth, likelihood, workers, executor):
+        kept = np.flatnonzero(vector > threshold)
+        instigators.append(np.full(len(kept), index, dtype=np.int32))
+        receivers.append(kept.astype(np.int32))
+        values.append(vector[kept])
+
+    instigators = np.concatenate(instigators) if instigators else np.zeros(0, dtype=np.int32)
+    receivers = np.concatenate(receivers) if receivers else np.zeros(0, dtype=np.int32)
+    values = np.concatenate(values) if values else np.zeros(0)
+
+    if dsm_impact.instigator == 'column':
+        rows, columns = receivers, instigators
+    else:
+        rows, columns = instigators, receivers
+
+    order = np.lexsort((columns, rows))
+    return rows[order], columns[order], values[order]
@@ -1,27 +1,174 @@
-from typing import Union
-from cpm.models import ChangePropagationTree, DSM
+from concurrent.futures import Executor
+from typing import Optional, Union
+import numpy as np
+from cpm.cache import ResultCache, result_key
+from cpm.models import DSM
+from cpm.parallel import iter_source_chunks
+from cpm.propagation import SourcePropagation
 
 
-def calculate_risk_matrix(dsm_impact: DSM, dsm_likelihood: DSM, search_depth=4) \
+class CPMMatrices:
+    """
+    Result matrices of a change propagation analysis of an entire DSM.
+    All matrices are laid out like the result of `calculate_risk_matrix()`.
+    """
+
+    def __init__(self, risk: np.ndarray, likelihood: np.ndarray, path_count: Optional[np.ndarray] = None,
+                 max_path_length: Optional[np.ndarray] = None, risk_error: Optional[np.ndarray] = None,
+                 likelihood_error: Optional[np.ndarray] = None):
+        """
+        :param risk: Combined risk
+        :param likelihood: Combined likelihood
+        :param path_count: Number of propagation paths
+        :param max_path_length: Length of the longest propagation path
+        :param risk_error: Largest possible error of an approximated risk. The exact risk is at least `risk`,
+        and at most `risk + risk_error`.
+        :param likelihood_error: Largest possible error of an approximated likelihood
+        """
+        self.risk: np.ndarray = risk
+        self.likelihood: np.ndarray = likelihood
+        self.path_count: Optional[np.ndarray] = path_count
+        self.max_path_length: Optional[np.ndarray] = max_path_length
+        self.risk_error: Optional[np.ndarray] = risk_error
+        self.likelihood_error: Optional[np.ndarray] = likelihood_error
+
+
+def _propagate_all(dsm_impact: DSM, dsm_likelihood: DSM, search_depth: int, path_statistics: bool,
+                   workers: Optional[int], executor: Optional[Executor], depth_sweep: bool = False,
+                   epsilon: Optional[float] = None) -> np.ndarray:
+    """
+    Propagate change from every sub-system.
+    :return: Stacked risk and probability matrices, followed by path count and maximum path length if
+    `path_statistics` is set, or the upper bounds of risk and probability if `epsilon` is set.
+    Matrices are laid out like the result of `calculate_risk_matrix()`.
+    With `depth_sweep`, each of them is a stack of matrices, one per search depth.
+    """
+    propagation = SourcePropagation(dsm_impact, dsm_likelihood, search_depth=search_depth, epsilon=epsilon)
+    size = propagation.size
+
+    # Rows are instigators, columns are targets
+    if epsilon is not None:
+        propagate = propagation.propagate_bounds
+        matrices = np.zeros((4, size, size))
+    elif depth_sweep:
+        propagate = propagation.propagate_by_depth
+        matrices = np.zeros((2, size, search_depth, size))
+    elif path_statistics:
+        propagate = propagation.propagate_statistics
+        matrices = np.zeros((4, size, size))
+    else:
+        propagate = propagation.propagate
+        matrices = np.zeros((2, size, size))
+
+    if (workers is not None and workers > 1) or executor is not None:
+        for sources, blocks in iter_source_chunks(dsm_impact, dsm_likelihood, search_depth=search_depth,
+                                                  workers=workers, executor=executor,
+                                                  path_statistics=path_statistics, depth_sweep=depth_sweep,
+                                                  epsilon=epsilon):
+            matrices[:, sources] = blocks
+    else:
+        for source_index in range(size):
+            matrices[:, source_index] = propagate(source_index)
+
+    if depth_sweep:
+        # Depth first, then instigators and targets
+        matrices = matrices.transpose(0, 2, 1, 3)
+
+    if dsm_impact.instigator == 'column':
+        matrices = matrices.swapaxes(-1, -2)
+
+    return matrices
+
+
+def calculate_risk_matrix(dsm_impact: DSM, dsm_likelihood: DSM, search_depth=4,
+                          workers: Optional[int] = None, executor: Optional[Executor] = None,
+                          cache: Optional[ResultCache] = None, epsilon: Optional[float] = None) \
         -> list[list[Union[float, str]]]:
     """
     Run Change Propagation algorithm on entire DSM, and generate a risk matrix.
+    Each instigating sub-system is propagated once, covering all of its targets in a single traversal.
     :param dsm_impact:
     :param dsm_likelihood:
     :param search_depth:
+    :param workers: Number of worker processes. By default, the matrix is calculated in the current process.
+    :param executor: Executor used to run chunks of sources in parallel, e.g. a `ProcessPoolExecutor`.
+    The DSMs are shared with the workers through shared memory.
+    :param cache: Cache to look the risk matrix up in, and to store it in after it has been calculated
+    :param epsilon: Approximate the risk by not exploring branches where the product of the likelihoods from the
+    instigator falls below epsilon. The error bounds are available through `calculate_cpm_matrices()`.
     :return:
     """
+    if cache is not None:
+        key = result_key(dsm_impact, dsm_likelihood, search_depth,
+                         kind='risk' if epsilon is None else f'risk-epsilon-{epsilon!r}')
+        cached = cache.get(key)
+        if cached is not None:
+            return cached.tolist()
 
-    cpm: list[list[Union[float, str]]] = []
+    matrices = _propagate_all(dsm_impact, dsm_likelihood, search_depth, False, workers, executor, epsilon=epsilon)
+
+    if cache is not None:
+        cache.put(key, matrices[0], metadata={'search_depth': search_depth})
+
+    return matrices[0].tolist()
+
+
+def calculate_cpm_matrices(dsm_impact: DSM, dsm_likelihood: DSM, search_depth: int = 4,
+                           path_statistics: bool = False, workers: Optional[int] = None,
+                           executor: Optional[Executor] = None, epsilon: Optional[float] = None) -> CPMMatrices:
+    """
+    Run Change Propagation algorithm on entire DSM, and generate the risk and likelihood matrices
+    in a single traversal per instigating sub-system.
+    :param dsm_impact: Impact DSM
+    :param dsm_likelihood: Likelihood DSM
+    :param search_depth: Maximum length of propagation paths
+    :param path_statistics: Also count the propagation paths between each pair of sub-systems,
+    and the length of the longest one
+    :param workers: Number of worker processes, see `calculate_risk_matrix()`
+    :param executor: Executor used to run chunks of sources in parallel, see `calculate_risk_matrix()`
+    :param epsilon: Approximate propagation, see `calculate_risk_matrix()`. The largest possible errors are
+    returned along with the approximated matrices, assuming likelihoods and impacts between 0 and 1.
+    :return: Risk and likelihood matrices, and the path statistics or error bounds if requested
+    """
+    if path_statistics and epsilon is not None:
+        raise ValueError('Path statistics are not available for approximate propagation.')
+
+    matrices = _propagate_all(dsm_impact, dsm_likelihood, search_depth, path_statistics, workers, executor,
+                              epsilon=epsilon)
+
+    if epsilon is not None:
+        return CPMMatrices(matrices[0], matrices[1], risk_error=matrices[2] - matrices[0],
+                           likelihood_error=matrices[3] - matrices[1])
+
+    if not path_statistics:
+        return CPMMatrices(matrices[0], matrices[1])
+
+    return CPMMatrices(matrices[0], matrices[1], path_count=matrices[2].astype(np.int64),
+                       max_path_length=matrices[3].astype(np.int64))
+
+
+def calculate_risk_matrices_by_depth(dsm_impact: DSM, dsm_likelihood: DSM, search_depth: int = 4,
+                                     likelihood: bool = False, workers: Optional[int] = None,
+                                     executor: Optional[Executor] = None) \
+        -> Union[np.ndarray, tuple[np.ndarray, np.ndarray]]:
+    """
+    Run Change Propagation algorithm on entire DSM for every search depth from 1 to `search_depth`.
+    The paths are only enumerated once, for the deepest search.
+    :param dsm_impact: Impact DSM
+    :param dsm_likelihood: Likelihood DSM
+    :param search_depth: Deepest search depth
+    :param likelihood: Also return the likelihood matrices
+    :param workers: Number of worker processes, see `calculate_risk_matrix()`
+    :param executor: Executor used to run chunks of sources in parallel, see `calculate_risk_matrix()`
+    :return: Risk matrices shaped (search_depth, N, N), where index d - 1 holds the risk matrix for search
+    depth d. With `likelihood`, a tuple of the risk and the likelihood matrices.
+    """
+    if search_depth < 1:
+        raise ValueError('search_depth needs to be at least 1.')
 
-    for l_index, lcol in enumerate(dsm_likelihood.columns):
-        cpm.append([])
+    matrices = _propagate_all(dsm_impact, dsm_likelihood, search_depth, False, workers, executor, depth_sweep=True)
 
-        for i_index, icol in enumerate(dsm_impact.columns):
-            cpt = ChangePropagationTree(i_index, l_index,
-                                        dsm_impact=dsm_impact,
-                                        dsm_likelihood=dsm_likelihood)
-            cpt.propagate(search_depth=search_depth)
-            cpm[l_index].append(cpt.get_risk())
+    if likelihood:
+        return matrices[0], matrices[1]
 
-    return cpm
+    return matrices[0]
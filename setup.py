@@ -20,7 +20,9 @@ setup(
     ],
     long_description=long_description,
     long_description_content_type='text/markdown',
-    install_requires=[],
+    install_requires=[
+        "numpy>=1.23"
+    ],
     extras_require={
         "dev": [
             "pytest==8.*",
@@ -0,0 +1,74 @@
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import numpy as np
+import pytest
+from cpm import aio
+from cpm.aio import calculate_risk_matrix_async, iter_risk_rows
+from cpm.parse import parse_csv
+from cpm.utils import calculate_cpm_matrices, calculate_risk_matrix
+
+
+class CountingExecutor(ThreadPoolExecutor):
+    def __init__(self):
+        super().__init__(max_workers=2)
+        self.submitted = 0
+
+    def submit(self, fn, /, *args, **kwargs):
+        self.submitted += 1
+        return super().submit(fn, *args, **kwargs)
+
+
+@pytest.mark.parametrize('instigator', ['column', 'row'])
+def test_async_rows(instigator):
+    dsm_p = parse_csv('./tests/test-assets/dsm-bm-8-probs.csv', instigator=instigator)
+    dsm_i = parse_csv('./tests/test-assets/dsm-bm-8-imps.csv', instigator=instigator)
+    expected = calculate_cpm_matrices(dsm_i, dsm_p, search_depth=4)
+
+    async def collect():
+        rows = {}
+        async for source, risk, likelihood in iter_risk_rows(dsm_i, dsm_p, search_depth=4, chunk_size=3):
+            rows[source] = (risk, likelihood)
+        return rows
+
+    async def run():
+        with CountingExecutor() as executor:
+            # Both requests share one computation
+            matrix, rows = await asyncio.gather(
+                calculate_risk_matrix_async(dsm_i, dsm_p, search_depth=4, executor=executor, chunk_size=3),
+                collect())
+        return matrix, rows, executor.submitted
+
+    matrix, rows, submitted = asyncio.run(run())
+
+    assert matrix == calculate_risk_matrix(dsm_i, dsm_p, search_depth=4)
+    assert submitted == 3
+    assert sorted(rows) == list(range(8))
+    for source, (risk, likelihood) in rows.items():
+        if instigator == 'column':
+            assert np.array_equal(risk, expected.risk[:, source])
+            assert np.array_equal(likelihood, expected.likelihood[:, source])
+        else:
+            assert np.array_equal(risk, expected.risk[source])
+    assert not aio._in_flight
+
+
+def test_async_cancellation():
+    dsm_p = parse_csv('./tests/test-assets/dsm-bm-8-probs.csv')
+    dsm_i = parse_csv('./tests/test-assets/dsm-bm-8-imps.csv')
+
+    async def first_row():
+        async for source, _, _ in iter_risk_rows(dsm_i, dsm_p, search_depth=4, executor=executor, chunk_size=1):
+            await asyncio.sleep(10)
+
+    async def run():
+        task = asyncio.create_task(first_row())
+        await asyncio.sleep(0.2)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        # The computation is stopped once nobody is waiting for it
+        assert not aio._in_flight
+        await asyncio.sleep(0.1)
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        asyncio.run(run())
@@ -0,0 +1,62 @@
+import pytest
+from cpm.analysis import ChangePropagationAnalysis
+from cpm.models import DSM
+from cpm.parse import parse_csv
+from cpm.utils import calculate_cpm_matrices
+
+
+def copy_dsm(dsm: DSM) -> DSM:
+    matrix = dsm.matrix.T if dsm.instigator == 'row' else dsm.matrix
+    return DSM(matrix.copy(), dsm.columns, dsm.instigator)
+
+
+@pytest.mark.parametrize('instigator', ['column', 'row'])
+def test_incremental_analysis(instigator):
+    suffix = '-transpose' if instigator == 'row' else ''
+    dsm_p = parse_csv(f'./tests/test-assets/dsm-bm-8-probs{suffix}.csv', instigator=instigator)
+    dsm_i = parse_csv(f'./tests/test-assets/dsm-bm-8-imps{suffix}.csv', instigator=instigator)
+
+    analysis = ChangePropagationAnalysis(dsm_i, dsm_p, search_depth=4)
+    network = dsm_p.node_network
+    for target in range(8):
+        dsm_p.distances_to(target, 4)
+
+    # Change an interaction, remove one, and add a new one
+    edits = [('likelihood', 2, 0, 0.9), ('likelihood', 2, 1, None), ('impact', 7, 0, 0.3),
+             ('likelihood', 7, 0, 0.25), ('impact', 6, 3, 0.1)]
+    for kind, row, column, value in edits:
+        if instigator == 'row':
+            row, column = column, row
+        if kind == 'likelihood':
+            recalculated = analysis.set_likelihood(row, column, value)
+        else:
+            recalculated = analysis.set_impact(row, column, value)
+        assert recalculated < 8 * 7
+
+        expected = calculate_cpm_matrices(copy_dsm(dsm_i), copy_dsm(dsm_p), search_depth=4)
+        assert analysis.risk.tolist() == expected.risk.tolist()
+        assert analysis.likelihood.tolist() == expected.likelihood.tolist()
+
+        # The neighbour indices and the cached hop distances are kept in sync
+        fresh = copy_dsm(dsm_p)
+        for index in ['indptr', 'indices', 'data']:
+            assert getattr(dsm_p, index).tolist() == getattr(fresh, index).tolist()
+        assert [index.tolist() for index in dsm_p.reverse_adjacency] == \
+               [index.tolist() for index in fresh.reverse_adjacency]
+        for target in range(8):
+            assert dsm_p.distances_to(target, 4).tolist() == fresh.distances_to(target, 4).tolist()
+
+    # The node network is kept in sync
+    assert network[0].neighbours[7] == 0.25
+    assert 2 not in network[1].neighbours
+
+
+def test_incremental_analysis_missing_impact():
+    dsm_p = parse_csv('./tests/test-assets/dsm-bm-8-probs.csv')
+    dsm_i = parse_csv('./tests/test-assets/dsm-bm-8-imps.csv')
+    analysis = ChangePropagationAnalysis(dsm_i, dsm_p, search_depth=4)
+
+    with pytest.raises(ValueError):
+        analysis.set_likelihood(1, 0, 0.5)
+    with pytest.raises(ValueError):
+        analysis.set_impact(2, 0, None)
@@ -0,0 +1,52 @@
+import os
+from cpm.cache import ResultCache, result_key
+from cpm.models import DSM
+from cpm.parse import parse_csv
+from cpm.utils import calculate_risk_matrix
+
+
+def test_cached_risk_matrix(tmp_path):
+    dsm_p = parse_csv('./tests/test-assets/dsm-bm-8-probs.csv')
+    dsm_i = parse_csv('./tests/test-assets/dsm-bm-8-imps.csv')
+    expected = calculate_risk_matrix(dsm_i, dsm_p, search_depth=4)
+
+    cache = ResultCache(str(tmp_path))
+    assert calculate_risk_matrix(dsm_i, dsm_p, search_depth=4, cache=cache) == expected
+    assert cache.misses == 1
+
+    # A new process only has the files on disk
+    cache = ResultCache(str(tmp_path))
+    assert calculate_risk_matrix(dsm_i, dsm_p, search_depth=4, cache=cache) == expected
+    assert calculate_risk_matrix(dsm_i, dsm_p, search_depth=4, cache=cache) == expected
+    assert cache.hits == 2
+    assert cache.misses == 0
+
+    # Any change to the DSMs or the search depth is a different result
+    matrix = dsm_p.matrix.copy()
+    matrix[matrix != 0] *= 0.5
+    changed = DSM(matrix, dsm_p.columns)
+    assert result_key(dsm_i, changed, 4) != result_key(dsm_i, dsm_p, 4)
+    assert result_key(dsm_i, dsm_p, 3) != result_key(dsm_i, dsm_p, 4)
+    assert result_key(dsm_i, DSM(dsm_p.matrix, list('abcdefgh')), 4) != result_key(dsm_i, dsm_p, 4)
+
+    calculate_risk_matrix(dsm_i, changed, search_depth=4, cache=cache)
+    assert cache.misses == 1
+
+
+def test_cache_eviction(tmp_path):
+    dsm_p = parse_csv('./tests/test-assets/dsm-bm-8-probs.csv')
+    dsm_i = parse_csv('./tests/test-assets/dsm-bm-8-imps.csv')
+
+    cache = ResultCache(str(tmp_path))
+    calculate_risk_matrix(dsm_i, dsm_p, search_depth=3, cache=cache)
+    old_file = os.path.join(str(tmp_path), result_key(dsm_i, dsm_p, 3) + '.cpm')
+    os.utime(old_file, (0, 0))
+
+    # Room for a single result
+    cache.max_bytes = os.path.getsize(old_file)
+    calculate_risk_matrix(dsm_i, dsm_p, search_depth=4, cache=cache)
+
+    assert os.listdir(str(tmp_path)) == [result_key(dsm_i, dsm_p, 4) + '.cpm']
+    # Evicted files are still served from memory
+    calculate_risk_matrix(dsm_i, dsm_p, search_depth=3, cache=cache)
+    assert cache.hits == 1
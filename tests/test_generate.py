@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+from cpm.generate import generate_dsm_pair
+from cpm.utils import calculate_risk_matrix
+
+
+def test_generate_dsm_pair():
+    dsm_i, dsm_l = generate_dsm_pair(60, density=0.2, modules=3, modularity=1, reciprocity=1, seed=3)
+    again_i, again_l = generate_dsm_pair(60, density=0.2, modules=3, modularity=1, reciprocity=1, seed=3)
+    assert np.array_equal(dsm_l.matrix, again_l.matrix) and np.array_equal(dsm_i.matrix, again_i.matrix)
+
+    interactions = dsm_l.matrix > 0
+    assert np.array_equal(interactions, dsm_i.matrix > 0)
+    assert np.array_equal(interactions, interactions.T)
+    assert not np.diag(interactions).any()
+    assert 0.15 < interactions.sum() / (60 * 59) < 0.25
+
+    # All interactions are within the three modules
+    module = np.arange(60) // 20
+    assert not (interactions & (module[:, None] != module[None, :])).any()
+
+    # The generated pair is valid input for propagation
+    calculate_risk_matrix(dsm_i, dsm_l, search_depth=3)
+
+
+def test_generate_distributions():
+    _, dsm_l = generate_dsm_pair(30, density=0.5, distribution='levels', parameters=[0.2, 0.6], seed=1)
+    assert set(np.unique(dsm_l.data).tolist()) == {0.2, 0.6}
+
+    _, dsm_l = generate_dsm_pair(30, density=0.5, distribution='beta', seed=1)
+    assert 0 < dsm_l.data.min() and dsm_l.data.max() < 1
+
+    with pytest.raises(ValueError):
+        generate_dsm_pair(30, distribution='normal')
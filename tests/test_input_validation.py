@@ -1,3 +1,4 @@
+import numpy as np
 import pytest
 from cpm.models import ChangePropagationTree, DSM
 from cpm.parse import parse_csv
@@ -52,3 +53,39 @@ def test_throws_if_dsm_size_mismatch():
     with pytest.raises(ValueError):
         # If DSMs are of different size, then input validation should prevent execution.
         ChangePropagationTree(0, 2, dsm_i, dsm_p)
+
+
+def test_throws_if_dsm_ragged():
+    mtx = [
+        [0.1, 0.2, 0.3],
+        [0.4, '-'],
+        [0.7, 0.8, 0.9],
+    ]
+    cols = ["a", "b", "c"]
+    with pytest.raises(ValueError):
+        DSM(mtx, cols)
+
+
+def test_throws_if_unknown_strategy():
+    dsm_p = parse_csv('./tests/test-assets/dsm-cpx-probs.csv')
+    dsm_i = parse_csv('./tests/test-assets/dsm-cpx-imps.csv')
+
+    with pytest.raises(ValueError):
+        ChangePropagationTree(0, 4, dsm_i, dsm_p).propagate(search_depth=4, strategy='random')
+
+
+def test_dsm_does_not_share_writable_arrays():
+    mtx = np.array([
+        [0.0, 0.2, 0.3],
+        [0.4, 0.0, 0.0],
+        [0.7, 0.0, 0.0],
+    ])
+    dsm = DSM(mtx, ["a", "b", "c"])
+    assert dsm.matrix is not mtx
+
+    dsm.set_value(1, 2, 0.5)
+    mtx[0, 1] = 0.9
+
+    assert mtx[1, 2] == 0.0
+    assert dsm.matrix[1, 2] == 0.5
+    assert dsm.matrix[0, 1] == 0.2
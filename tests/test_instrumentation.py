@@ -0,0 +1,61 @@
+from concurrent.futures import ThreadPoolExecutor
+from cpm.instrumentation import PropagationStats, active_stats
+from cpm.models import ChangePropagationTree
+from cpm.parse import parse_csv
+from cpm.utils import calculate_risk_matrix
+
+
+def test_propagation_stats():
+    events = []
+    with PropagationStats(callback=events.append, slowest=2) as stats:
+        dsm_p = parse_csv('./tests/test-assets/dsm-cpx-probs.csv')
+        dsm_i = parse_csv('./tests/test-assets/dsm-cpx-imps.csv')
+        assert active_stats() is stats
+
+        breadth = ChangePropagationTree(6, 2, dsm_i, dsm_p).propagate(search_depth=4)
+        breadth.get_risk()
+        breadth.get_probability()
+        counters = dict(stats.counters)
+        ChangePropagationTree(6, 2, dsm_i, dsm_p).propagate(search_depth=4, strategy='depth')
+        ChangePropagationTree(0, 3, dsm_i, dsm_p).propagate(search_depth=4)
+
+    assert active_stats() is None
+    # Both strategies visit the same leaves
+    assert counters['leaves'] == len(breadth._node) == 11
+    assert counters['target_paths'] == 4
+    assert stats.counters['leaves'] >= 2 * counters['leaves']
+    assert stats.counters['target_paths'] >= 2 * counters['target_paths']
+
+    assert stats.phase_calls == {'parse_csv': 2, 'propagate': 3, 'get_risk': 1, 'get_probability': 1}
+    assert [event['phase'] for event in events].count('propagate') == 3
+    assert len(stats.slowest_pairs) == 2
+    assert stats.slowest_pairs[0][0] >= stats.slowest_pairs[1][0]
+
+    # Nothing is recorded when the stats are not active
+    ChangePropagationTree(6, 2, dsm_i, dsm_p).propagate(search_depth=4).get_risk()
+    assert stats.phase_calls['propagate'] == 3
+
+
+def test_risk_matrix_stats():
+    dsm_p = parse_csv('./tests/test-assets/dsm-bm-8-probs.csv')
+    dsm_i = parse_csv('./tests/test-assets/dsm-bm-8-imps.csv')
+
+    with PropagationStats(slowest=3) as stats:
+        calculate_risk_matrix(dsm_i, dsm_p, search_depth=4)
+
+    # Every source is timed, and propagation to all targets at once is reported without a target
+    assert stats.phase_calls == {'propagate_source': 8}
+    assert stats.counters['leaves'] > 8
+    assert stats.counters['target_paths'] > 0
+    assert stats.counters['cycle_pruned'] > 0
+    assert [target for _, _, target in stats.slowest_pairs] == [None] * 3
+
+    # Workers in other threads and processes report their stats back
+    with ThreadPoolExecutor(max_workers=2) as executor, PropagationStats() as threaded:
+        calculate_risk_matrix(dsm_i, dsm_p, search_depth=4, executor=executor)
+    with PropagationStats() as processes:
+        calculate_risk_matrix(dsm_i, dsm_p, search_depth=4, workers=2)
+
+    assert threaded.counters == stats.counters
+    assert processes.counters == stats.counters
+    assert processes.phase_calls == {'propagate_source': 8}
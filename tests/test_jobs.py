@@ -0,0 +1,51 @@
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pytest
+from cpm.jobs import run_risk_matrix_job
+from cpm.parse import parse_csv
+from cpm.utils import calculate_cpm_matrices
+
+
+@pytest.mark.parametrize('instigator', ['column', 'row'])
+def test_resumed_job(instigator, tmp_path):
+    dsm_p = parse_csv('./tests/test-assets/dsm-bm-8-probs.csv', instigator=instigator)
+    dsm_i = parse_csv('./tests/test-assets/dsm-bm-8-imps.csv', instigator=instigator)
+    expected = calculate_cpm_matrices(dsm_i, dsm_p, search_depth=4)
+    checkpoint = str(tmp_path / 'job.cpm')
+
+    # Interrupt the job after three instigators
+    def interrupt(done, total, source):
+        if done == 3:
+            raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        run_risk_matrix_job(dsm_i, dsm_p, search_depth=4, progress=interrupt, checkpoint=checkpoint)
+
+    reports = []
+    job = run_risk_matrix_job(dsm_i, dsm_p, search_depth=4, checkpoint=checkpoint,
+                              progress=lambda *report: reports.append(report))
+    assert [done for done, _, _ in reports] == [4, 5, 6, 7, 8]
+    assert job.complete
+    assert np.array_equal(job.risk, expected.risk)
+    assert np.array_equal(job.likelihood, expected.likelihood)
+
+    # A checkpoint of another search depth is refused
+    with pytest.raises(ValueError):
+        run_risk_matrix_job(dsm_i, dsm_p, search_depth=3, checkpoint=checkpoint)
+
+
+def test_time_budget():
+    dsm_p = parse_csv('./tests/test-assets/dsm-bm-8-probs.csv')
+    dsm_i = parse_csv('./tests/test-assets/dsm-bm-8-imps.csv')
+    expected = calculate_cpm_matrices(dsm_i, dsm_p, search_depth=4)
+
+    job = run_risk_matrix_job(dsm_i, dsm_p, search_depth=4, time_budget=0)
+    assert not job.completed.any() and not job.risk.any()
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        job = run_risk_matrix_job(dsm_i, dsm_p, search_depth=4, time_budget=0, executor=executor)
+    # Columns are instigators. Completed columns are exact.
+    assert job.completed.any() and not job.complete
+    assert np.array_equal(job.completed, np.repeat(job.completed[:1], 8, axis=0))
+    assert np.array_equal(job.risk[job.completed], expected.risk[job.completed])
+    assert not job.risk[~job.completed].any()
@@ -0,0 +1,71 @@
+from cpm.memo import MemoizedPropagation, PropagationCache
+from cpm.models import ChangePropagationTree
+from cpm.parse import parse_csv
+
+
+def test_memoized_matches_tree():
+    dsm_p = parse_csv('./tests/test-assets/dsm-bm-8-probs-transpose.csv', instigator='row')
+    dsm_i = parse_csv('./tests/test-assets/dsm-bm-8-imps-transpose.csv', instigator='row')
+
+    memo = MemoizedPropagation(dsm_i, dsm_p)
+
+    for start, _ in enumerate(dsm_p.columns):
+        for target, _ in enumerate(dsm_p.columns):
+            cpt = ChangePropagationTree(start, target, dsm_i, dsm_p).propagate(search_depth=5)
+            risk, prob = memo.evaluate(start, target, search_depth=5)
+            assert risk == cpt.get_risk()
+            assert prob == cpt.get_probability()
+
+    assert memo.cache.hits > 0
+    assert memo.cache.evictions == 0
+
+
+def test_memoized_bounded_cache():
+    dsm_p = parse_csv('./tests/test-assets/dsm-cpx-probs.csv')
+    dsm_i = parse_csv('./tests/test-assets/dsm-cpx-imps.csv')
+
+    memo = MemoizedPropagation(dsm_i, dsm_p, max_entries=4)
+
+    for start, _ in enumerate(dsm_p.columns):
+        cpt = ChangePropagationTree(start, 0, dsm_i, dsm_p).propagate(search_depth=4)
+        assert memo.get_risk(start, 0) == cpt.get_risk()
+        assert memo.get_probability(start, 0) == cpt.get_probability()
+
+    assert len(memo.cache) <= 4
+    assert memo.cache.evictions > 0
+
+
+def test_cache_statistics():
+    cache = PropagationCache(max_entries=2)
+    cache.put('a', 1)
+    cache.put('b', None)
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+
+    # 'a' was used more recently than 'b'
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert cache.get('b', 'missing') == 'missing'
+    assert (cache.hits, cache.misses, cache.evictions) == (3, 1, 1)
+    assert cache.hit_rate == 0.75
+
+
+def test_memoized_follows_dsm_edits():
+    dsm_p = parse_csv('./tests/test-assets/dsm-bm-8-probs.csv')
+    dsm_i = parse_csv('./tests/test-assets/dsm-bm-8-imps.csv')
+
+    memo = MemoizedPropagation(dsm_i, dsm_p)
+    before = [memo.evaluate(start, target, search_depth=4) for start in range(8) for target in range(8)]
+
+    # Change one interaction from A, and remove another one
+    first, second = dsm_p.indices[dsm_p.indptr[0]:dsm_p.indptr[1]][:2].tolist()
+    dsm_p.set_value(first, 0, 0.3)
+    dsm_i.set_value(first, 0, 0.9)
+    dsm_p.set_value(second, 0, None)
+
+    after = [memo.evaluate(start, target, search_depth=4) for start in range(8) for target in range(8)]
+    assert after != before
+    for start in range(8):
+        for target in range(8):
+            cpt = ChangePropagationTree(start, target, dsm_i, dsm_p).propagate(search_depth=4)
+            assert after[start * 8 + target] == (cpt.get_risk(), cpt.get_probability())
@@ -0,0 +1,31 @@
+import numpy as np
+from cpm.montecarlo import simulate_propagation
+from cpm.parse import parse_csv
+from cpm.utils import calculate_cpm_matrices
+
+
+def test_simulate_single_paths():
+    # Every pair of the network test DSM is connected by a single path, so cascades agree with Clarkson
+    dsm = parse_csv('./tests/test-assets/dsm-network-test.csv')
+    exact = calculate_cpm_matrices(dsm, dsm, search_depth=4)
+    estimate = simulate_propagation(dsm, dsm, search_depth=4, samples=20000, seed=1, confidence=0.999)
+
+    assert np.all(estimate.risk_interval[0] <= exact.risk)
+    assert np.all(exact.risk <= estimate.risk_interval[1])
+    assert np.all(estimate.likelihood_interval[0] <= exact.likelihood)
+    assert np.all(exact.likelihood <= estimate.likelihood_interval[1])
+    assert np.all(np.diag(estimate.risk) == 0)
+
+
+def test_simulate_reproducible():
+    dsm_p = parse_csv('./tests/test-assets/dsm-bm-8-probs.csv')
+    dsm_i = parse_csv('./tests/test-assets/dsm-bm-8-imps.csv')
+    first = simulate_propagation(dsm_i, dsm_p, search_depth=3, samples=1000, sources=[1, 4], seed=7, batch_size=300)
+    second = simulate_propagation(dsm_i, dsm_p, search_depth=3, samples=1000, sources=[1, 4], seed=7, batch_size=300)
+
+    assert np.array_equal(first.risk, second.risk, equal_nan=True)
+    # Only the selected instigators (columns) are simulated
+    assert not np.isnan(first.risk[:, [1, 4]]).any()
+    assert np.isnan(np.delete(first.risk, [1, 4], axis=1)).all()
+    simulated = first.risk[:, [1, 4]]
+    assert np.all(simulated <= first.likelihood[:, [1, 4]])
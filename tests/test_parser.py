@@ -1,3 +1,6 @@
+from io import StringIO
+import pytest
+from cpm.exceptions import CSVParseError
 from cpm.parse import parse_csv
 
 
@@ -65,3 +68,45 @@ def test_parse_file_object():
 
         for col in ['A', 'B', 'C', 'D']:
             assert col in dsm.columns
+
+
+def test_parse_dsm_adjacency():
+    dsm = parse_csv('./tests/test-assets/dsm-cpx-probs.csv')
+
+    for index, node in dsm.node_network.items():
+        start, end = dsm.indptr[index], dsm.indptr[index + 1]
+        assert list(node.neighbours.keys()) == dsm.indices[start:end].tolist()
+        assert list(node.neighbours.values()) == dsm.data[start:end].tolist()
+
+
+def test_parse_dsm_instigator_row_is_view():
+    dsm = parse_csv('./tests/test-assets/dsm-network-test.csv', instigator='row')
+
+    assert dsm.matrix.base is not None
+    assert dsm.matrix[3][0] == 0.5
+    assert dsm.matrix.base[0][3] == 0.5
+
+
+def test_parse_reports_malformed_cell():
+    content = 'x;A;B;C\nA;A;0.1;\nB;0.2;B;oops\nC;;0.3;C\n'
+
+    with pytest.raises(CSVParseError) as error:
+        parse_csv(StringIO(content))
+
+    assert error.value.row == 1
+    assert error.value.column == 2
+
+
+def test_parse_non_square():
+    content = 'x;A;B;C\nA;A;0.1;\nB;0.2;B;0.4\n'
+
+    with pytest.raises(CSVParseError):
+        parse_csv(StringIO(content))
+
+
+def test_parse_multi_character_delimiter():
+    content = '\t; A; B\nA; A; 0.5\nB; 0.25; B\n'
+    dsm = parse_csv(StringIO(content), delimiter='; ')
+
+    assert dsm.columns == ['A', 'B']
+    assert dsm.matrix.tolist() == [[0, 0.5], [0.25, 0]]
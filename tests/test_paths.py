@@ -0,0 +1,38 @@
+from cpm.parse import parse_csv
+from cpm.paths import critical_paths
+from cpm.utils import calculate_cpm_matrices
+
+
+def test_critical_paths():
+    dsm_p = parse_csv('./tests/test-assets/dsm-cpx-probs.csv')
+    dsm_i = parse_csv('./tests/test-assets/dsm-cpx-imps.csv')
+    statistics = calculate_cpm_matrices(dsm_i, dsm_p, search_depth=4, path_statistics=True)
+
+    for by in ['likelihood', 'risk']:
+        paths = critical_paths(6, 2, dsm_i, dsm_p, k=1000, search_depth=4, by=by)
+
+        # All paths are found when k is large enough, best first
+        assert len(paths) == statistics.path_count[2][6] == 4
+        values = [getattr(path, by) for path in paths]
+        assert values == sorted(values, reverse=True)
+
+        for path in paths:
+            assert path.nodes[0] == 6 and path.nodes[-1] == 2
+            assert 1 <= len(path) <= 4
+            likelihood = 1
+            for instigator, receiver in zip(path.nodes, path.nodes[1:]):
+                likelihood *= dsm_p.matrix[receiver][instigator]
+            assert abs(path.likelihood - likelihood) < 1e-12
+            assert abs(path.risk - likelihood * dsm_i.matrix[2][path.nodes[-2]]) < 1e-12
+
+        top = critical_paths(6, 2, dsm_i, dsm_p, k=3, search_depth=4, by=by)
+        assert [getattr(path, by) for path in top] == values[:3]
+
+
+def test_critical_paths_unreachable():
+    dsm = parse_csv('./tests/test-assets/dsm-network-test.csv')
+
+    # B is three interactions away from D
+    assert critical_paths(3, 1, dsm, dsm, k=5, search_depth=2) == []
+    paths = critical_paths(3, 1, dsm, dsm, k=5, search_depth=3)
+    assert [path.columns for path in paths] == [['D', 'A', 'C', 'B']]
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+from cpm.models import ChangePropagationTree, DSM
+from cpm.parse import parse_csv
+from cpm.plans import compile_pair, compile_risk_matrix
+from cpm.utils import calculate_risk_matrix
+
+
+def _scenarios(dsm: DSM) -> np.ndarray:
+    matrix = dsm.matrix.T if dsm.instigator == 'row' else dsm.matrix
+    matrix = np.where(np.eye(len(matrix), dtype=bool), 0, matrix)
+    return np.stack([matrix, matrix * 0.5, matrix ** 2])
+
+
+def test_risk_matrix_plan():
+    dsm_p = parse_csv('./tests/test-assets/dsm-bm-8-probs.csv')
+    dsm_i = parse_csv('./tests/test-assets/dsm-bm-8-imps.csv')
+
+    plan = compile_risk_matrix(dsm_i, dsm_p, search_depth=4)
+    likelihoods = _scenarios(dsm_p)
+    impacts = _scenarios(dsm_i)
+
+    risks = plan.evaluate(likelihoods, impacts)
+    assert risks.shape == (3, 8, 8)
+
+    for k in range(3):
+        expected = calculate_risk_matrix(DSM(impacts[k], dsm_i.columns), DSM(likelihoods[k], dsm_p.columns))
+        assert risks[k].tolist() == expected
+
+
+def test_pair_plan_instigator_row():
+    dsm_p = parse_csv('./tests/test-assets/dsm-bm-8-probs-transpose.csv', instigator='row')
+    dsm_i = parse_csv('./tests/test-assets/dsm-bm-8-imps-transpose.csv', instigator='row')
+
+    plan = compile_pair(2, 5, dsm_i, dsm_p, search_depth=4)
+    cpt = ChangePropagationTree(2, 5, dsm_i, dsm_p).propagate(search_depth=4)
+
+    likelihoods = _scenarios(dsm_p)
+    assert plan.evaluate(likelihoods[0], _scenarios(dsm_i)[0]) == cpt.get_risk()
+    assert plan.evaluate_probability(likelihoods)[0] == cpt.get_probability()
+
+
+def test_plan_rejects_new_interactions():
+    dsm_p = parse_csv('./tests/test-assets/dsm-cpx-probs.csv')
+    dsm_i = parse_csv('./tests/test-assets/dsm-cpx-imps.csv')
+
+    plan = compile_pair(0, 7, dsm_i, dsm_p, search_depth=4)
+    likelihoods = _scenarios(dsm_p)
+    likelihoods[1, 1, 0] = 0.5
+
+    with pytest.raises(ValueError):
+        plan.evaluate(likelihoods, _scenarios(dsm_i))
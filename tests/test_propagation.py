@@ -1,6 +1,10 @@
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pytest
 from cpm.models import ChangePropagationTree, DSM
 from cpm.parse import parse_csv
-from cpm.utils import calculate_risk_matrix
+from cpm.propagation import SourcePropagation
+from cpm.utils import calculate_cpm_matrices, calculate_risk_matrices_by_depth, calculate_risk_matrix
 
 
 def test_risk_calculation_1():
@@ -153,3 +157,224 @@ def test_dsm_input_robustness():
             if i == j:
                 continue
             assert abs(res_mtx[i][j] - dsm_r.matrix[i][j]) < 0.001, f"Failed for index i={i} (row {col_i}), j={j} (col {col_j})"
+
+
+def test_source_propagation_matches_tree():
+    dsm_p = parse_csv('./tests/test-assets/dsm-bm-8-probs.csv')
+    dsm_i = parse_csv('./tests/test-assets/dsm-bm-8-imps.csv')
+
+    propagation = SourcePropagation(dsm_i, dsm_p, search_depth=4)
+
+    for start, _ in enumerate(dsm_p.columns):
+        risk, prob = propagation.propagate(start)
+        for target, _ in enumerate(dsm_p.columns):
+            cpt = ChangePropagationTree(start_index=start, target_index=target, dsm_impact=dsm_i, dsm_likelihood=dsm_p)
+            cpt.propagate(search_depth=4)
+            # Branches are combined in the same order, so results are identical
+            assert risk[target] == cpt.get_risk()
+            assert prob[target] == cpt.get_probability()
+
+
+def test_parallel_risk_matrix():
+    dsm_p = parse_csv('./tests/test-assets/dsm-bm-8-probs-transpose.csv', instigator='row')
+    dsm_i = parse_csv('./tests/test-assets/dsm-bm-8-imps-transpose.csv', instigator='row')
+
+    serial = calculate_risk_matrix(dsm_i, dsm_p, search_depth=4)
+
+    assert calculate_risk_matrix(dsm_i, dsm_p, search_depth=4, workers=2) == serial
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        assert calculate_risk_matrix(dsm_i, dsm_p, search_depth=4, executor=executor) == serial
+
+
+def test_hop_distances():
+    dsm = parse_csv('./tests/test-assets/dsm-network-test.csv')
+
+    # D -> A -> C -> B -> D
+    assert dsm.distances_from(3, 4).tolist() == [1, 3, 2, 0]
+    assert dsm.distances_from(0, 4).tolist() == [0, 2, 1, 3]
+    assert dsm.distances_to(3, 4).tolist() == [3, 1, 2, 0]
+    # Distances beyond the maximum depth are reported as one more than it
+    assert dsm.distances_from(0, 1).tolist() == [0, 2, 1, 2]
+
+
+def test_unreachable_pair_is_pruned():
+    dsm_p = parse_csv('./tests/test-assets/dsm-network-test.csv')
+    dsm_i = parse_csv('./tests/test-assets/dsm-network-test.csv')
+
+    # B is three interactions away from D
+    cpt = ChangePropagationTree(start_index=3, target_index=1, dsm_impact=dsm_i, dsm_likelihood=dsm_p)
+    cpt.propagate(search_depth=2)
+    assert len(cpt.start_leaf.next) == 0
+    assert cpt.get_risk() == 0
+
+    cpt.propagate(search_depth=3)
+    assert abs(cpt.get_risk() - 0.5 ** 4) < 1e-12
+
+
+def test_zero_search_depth():
+    dsm_p = parse_csv('./tests/test-assets/dsm-cpx-probs.csv')
+    dsm_i = parse_csv('./tests/test-assets/dsm-cpx-imps.csv')
+
+    for strategy in ['breadth', 'depth']:
+        cpt = ChangePropagationTree(6, 2, dsm_i, dsm_p).propagate(search_depth=0, strategy=strategy)
+        assert cpt.get_risk() == 0
+        assert cpt.get_probability() == 0
+
+
+def test_start_leaf_view():
+    dsm_p = parse_csv('./tests/test-assets/dsm-cpx-probs.csv')
+    dsm_i = parse_csv('./tests/test-assets/dsm-cpx-imps.csv')
+
+    cpt = ChangePropagationTree(start_index=7, target_index=0, dsm_impact=dsm_i, dsm_likelihood=dsm_p)
+    cpt.propagate(search_depth=4)
+
+    # The linked leaves evaluate recursively to the same numbers as the flat tree
+    assert cpt.start_leaf.get_risk() == cpt.get_risk()
+    assert cpt.start_leaf.get_probability() == cpt.get_probability()
+    for leaf in cpt.start_leaf.next.values():
+        assert leaf.level == 1
+        assert leaf.parent is cpt.start_leaf
+
+
+def test_depth_first_strategy():
+    dsm_p = parse_csv('./tests/test-assets/dsm-cpx-probs.csv')
+    dsm_i = parse_csv('./tests/test-assets/dsm-cpx-imps.csv')
+
+    for start, _ in enumerate(dsm_p.columns):
+        for target, _ in enumerate(dsm_p.columns):
+            bfs = ChangePropagationTree(start, target, dsm_i, dsm_p).propagate(search_depth=4)
+            dfs = ChangePropagationTree(start, target, dsm_i, dsm_p).propagate(search_depth=4, strategy='depth')
+
+            assert dfs.start_leaf is None
+            assert dfs.get_risk() == bfs.get_risk()
+            assert dfs.get_probability() == bfs.get_probability()
+
+
+def test_cpm_matrices():
+    dsm_p = parse_csv('./tests/test-assets/dsm-cpx-probs.csv')
+    dsm_i = parse_csv('./tests/test-assets/dsm-cpx-imps.csv')
+    dsm_r = parse_csv('./tests/test-assets/dsm-cpx-answers-risks.csv')
+    dsm_l = parse_csv('./tests/test-assets/dsm-cpx-answers-probs.csv')
+
+    res = calculate_cpm_matrices(dsm_i, dsm_p, search_depth=4)
+
+    assert res.risk.tolist() == calculate_risk_matrix(dsm_i, dsm_p, search_depth=4)
+    assert res.path_count is None
+    for i, _ in enumerate(dsm_p.columns):
+        for j, _ in enumerate(dsm_p.columns):
+            if i == j:
+                continue
+            assert abs(res.risk[i][j] - dsm_r.matrix[i][j]) < 0.001
+            assert abs(res.likelihood[i][j] - dsm_l.matrix[i][j]) < 0.001
+
+
+def test_cpm_path_statistics():
+    dsm_p = parse_csv('./tests/test-assets/dsm-bm-8-probs.csv')
+    dsm_i = parse_csv('./tests/test-assets/dsm-bm-8-imps.csv')
+
+    def simple_paths(node, target, visited, remaining):
+        # Lengths of all simple paths from node to target. Column instigators propagate from column to row.
+        if remaining == 0:
+            return []
+        lengths = []
+        for neighbour, _ in enumerate(dsm_p.columns):
+            if neighbour in visited or not dsm_p.matrix[neighbour][node]:
+                continue
+            if neighbour == target:
+                lengths.append(1)
+            else:
+                lengths += [length + 1 for length in
+                            simple_paths(neighbour, target, visited | {neighbour}, remaining - 1)]
+        return lengths
+
+    res = calculate_cpm_matrices(dsm_i, dsm_p, search_depth=4, path_statistics=True)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        res_parallel = calculate_cpm_matrices(dsm_i, dsm_p, search_depth=4, path_statistics=True,
+                                              executor=executor)
+
+    for i, _ in enumerate(dsm_p.columns):
+        for j, _ in enumerate(dsm_p.columns):
+            lengths = simple_paths(j, i, {j}, 4) if i != j else []
+            assert res.path_count[i][j] == len(lengths)
+            assert res.max_path_length[i][j] == max(lengths, default=0)
+
+    for name in ['risk', 'likelihood', 'path_count', 'max_path_length']:
+        assert getattr(res_parallel, name).tolist() == getattr(res, name).tolist()
+
+
+def test_tree_values_by_depth():
+    dsm_p = parse_csv('./tests/test-assets/dsm-cpx-probs.csv')
+    dsm_i = parse_csv('./tests/test-assets/dsm-cpx-imps.csv')
+
+    for start, _ in enumerate(dsm_p.columns):
+        for target, _ in enumerate(dsm_p.columns):
+            cpt = ChangePropagationTree(start, target, dsm_i, dsm_p).propagate(search_depth=5)
+            risks = cpt.get_risk_by_depth()
+            probs = cpt.get_probability_by_depth()
+
+            assert len(risks) == 5
+            for depth in range(1, 6):
+                shallow = ChangePropagationTree(start, target, dsm_i, dsm_p).propagate(search_depth=depth)
+                assert risks[depth - 1] == shallow.get_risk()
+                assert probs[depth - 1] == shallow.get_probability()
+
+
+def test_risk_matrices_by_depth():
+    dsm_p = parse_csv('./tests/test-assets/dsm-bm-8-probs-transpose.csv', instigator='row')
+    dsm_i = parse_csv('./tests/test-assets/dsm-bm-8-imps-transpose.csv', instigator='row')
+
+    risks, likelihoods = calculate_risk_matrices_by_depth(dsm_i, dsm_p, search_depth=5, likelihood=True)
+
+    assert risks.shape == (5, 8, 8)
+    for depth in range(1, 6):
+        res = calculate_cpm_matrices(dsm_i, dsm_p, search_depth=depth)
+        assert risks[depth - 1].tolist() == res.risk.tolist()
+        assert likelihoods[depth - 1].tolist() == res.likelihood.tolist()
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        parallel = calculate_risk_matrices_by_depth(dsm_i, dsm_p, search_depth=5, executor=executor)
+    assert parallel.tolist() == risks.tolist()
+
+
+def test_approximate_tree():
+    dsm_p = parse_csv('./tests/test-assets/dsm-cpx-probs.csv')
+    dsm_i = parse_csv('./tests/test-assets/dsm-cpx-imps.csv')
+
+    pruned = 0
+    for start, _ in enumerate(dsm_p.columns):
+        for target, _ in enumerate(dsm_p.columns):
+            exact = ChangePropagationTree(start, target, dsm_i, dsm_p).propagate(search_depth=4)
+            approximate = ChangePropagationTree(start, target, dsm_i, dsm_p)
+            approximate.propagate(search_depth=4, strategy='depth', epsilon=0.1)
+
+            bound = approximate.get_error_bound()
+            assert approximate.get_risk() <= exact.get_risk() <= approximate.get_risk() + bound
+            if bound > 0:
+                pruned += 1
+            assert exact.get_error_bound() == 0
+
+    assert pruned > 0
+
+    with pytest.raises(ValueError):
+        ChangePropagationTree(0, 1, dsm_i, dsm_p).propagate(search_depth=4, epsilon=0.1)
+
+
+def test_approximate_cpm_matrices():
+    dsm_p = parse_csv('./tests/test-assets/dsm-bm-8-probs.csv')
+    dsm_i = parse_csv('./tests/test-assets/dsm-bm-8-imps.csv')
+
+    exact = calculate_cpm_matrices(dsm_i, dsm_p, search_depth=4)
+    res = calculate_cpm_matrices(dsm_i, dsm_p, search_depth=4, epsilon=0.05)
+
+    assert res.risk_error.max() > 0
+    assert np.all(res.risk <= exact.risk)
+    assert np.all(exact.risk <= res.risk + res.risk_error)
+    assert np.all(res.likelihood <= exact.likelihood)
+    assert np.all(exact.likelihood <= res.likelihood + res.likelihood_error)
+    assert calculate_risk_matrix(dsm_i, dsm_p, search_depth=4, epsilon=0.05) == res.risk.tolist()
+
+    # Nothing is pruned with epsilon 0
+    res = calculate_cpm_matrices(dsm_i, dsm_p, search_depth=4, epsilon=0)
+    assert res.risk.tolist() == exact.risk.tolist()
+    assert not res.risk_error.any()
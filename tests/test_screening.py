@@ -0,0 +1,34 @@
+import numpy as np
+from cpm.parse import parse_csv
+from cpm.screening import screen_risk_matrix
+from cpm.utils import calculate_cpm_matrices
+
+
+def test_screening_bounds():
+    for instigator in ['column', 'row']:
+        dsm_p = parse_csv('./tests/test-assets/dsm-cpx-probs.csv', instigator=instigator)
+        dsm_i = parse_csv('./tests/test-assets/dsm-cpx-imps.csv', instigator=instigator)
+
+        for search_depth in [1, 2, 4]:
+            exact = calculate_cpm_matrices(dsm_i, dsm_p, search_depth=search_depth)
+            bounds = screen_risk_matrix(dsm_i, dsm_p, search_depth=search_depth)
+
+            assert np.all(bounds.risk_lower <= exact.risk + 1e-12)
+            assert np.all(exact.risk <= bounds.risk_upper + 1e-12)
+            assert np.all(bounds.likelihood_lower <= exact.likelihood + 1e-12)
+            assert np.all(exact.likelihood <= bounds.likelihood_upper + 1e-12)
+            assert not bounds.refined.any()
+
+
+def test_screening_threshold():
+    dsm_p = parse_csv('./tests/test-assets/dsm-bm-8-probs.csv')
+    dsm_i = parse_csv('./tests/test-assets/dsm-bm-8-imps.csv')
+    exact = calculate_cpm_matrices(dsm_i, dsm_p, search_depth=4)
+    bounds = screen_risk_matrix(dsm_i, dsm_p, search_depth=4, threshold=0.2)
+
+    # Pairs that may reach the threshold are exact, the others are below it
+    assert bounds.refined.any()
+    assert np.array_equal(bounds.risk_lower[bounds.refined], exact.risk[bounds.refined])
+    assert np.array_equal(bounds.risk_upper[bounds.refined], exact.risk[bounds.refined])
+    assert np.all(exact.risk[~bounds.refined] < 0.2)
+    assert all(bounds.refined[row][column] for row, column in bounds.candidates(0.2))
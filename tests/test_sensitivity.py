@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+from cpm.models import DSM
+from cpm.parse import parse_csv
+from cpm.sensitivity import risk_sensitivity
+from cpm.utils import calculate_risk_matrix
+
+
+@pytest.mark.parametrize('instigator', ['column', 'row'])
+def test_sensitivity_matches_finite_differences(instigator):
+    suffix = '-transpose' if instigator == 'row' else ''
+    dsm_p = parse_csv(f'./tests/test-assets/dsm-bm-8-probs{suffix}.csv', instigator=instigator)
+    dsm_i = parse_csv(f'./tests/test-assets/dsm-bm-8-imps{suffix}.csv', instigator=instigator)
+    likelihood = np.array(dsm_p.matrix.T if instigator == 'row' else dsm_p.matrix)
+    impact = np.array(dsm_i.matrix.T if instigator == 'row' else dsm_i.matrix)
+
+    weights = np.zeros((8, 8))
+    weights[2, 5] = 1
+    weights[7, 0] = 0.5
+    sensitivity = risk_sensitivity(dsm_i, dsm_p, search_depth=4, weights=weights)
+
+    assert sensitivity.risk.tolist() == calculate_risk_matrix(dsm_i, dsm_p, search_depth=4)
+
+    def weighted_risk(impacts, likelihoods):
+        risk = calculate_risk_matrix(DSM(impacts, dsm_i.columns, instigator),
+                                     DSM(likelihoods, dsm_p.columns, instigator), search_depth=4)
+        return np.sum(weights * np.array(risk))
+
+    step = 1e-6
+    base = weighted_risk(impact, likelihood)
+    for row, column in zip(*np.nonzero(likelihood)):
+        if row == column:
+            continue
+        changed = likelihood.copy()
+        changed[row, column] += step
+        difference = (weighted_risk(impact, changed) - base) / step
+        assert abs(difference - sensitivity.likelihood_gradient[row, column]) < 1e-5
+
+        changed = impact.copy()
+        changed[row, column] += step
+        difference = (weighted_risk(changed, likelihood) - base) / step
+        assert abs(difference - sensitivity.impact_gradient[row, column]) < 1e-5
+
+
+def test_sensitivity_top_cells():
+    dsm_p = parse_csv('./tests/test-assets/dsm-cpx-probs.csv')
+    dsm_i = parse_csv('./tests/test-assets/dsm-cpx-imps.csv')
+
+    sensitivity = risk_sensitivity(dsm_i, dsm_p, search_depth=4)
+    top = sensitivity.top(5)
+
+    assert len(top) == 5
+    assert [value for _, _, value in top] == sorted((value for _, _, value in top), reverse=True)
+    assert top[0][2] == sensitivity.likelihood_gradient.max()
+    assert sensitivity.top(3, of='impact')[0][2] == sensitivity.impact_gradient.max()
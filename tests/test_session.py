@@ -0,0 +1,32 @@
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from cpm.models import ChangePropagationTree
+from cpm.parse import parse_csv
+from cpm.session import AnalysisSession
+
+
+@pytest.mark.parametrize('instigator', ['column', 'row'])
+def test_session(instigator):
+    dsm_p = parse_csv('./tests/test-assets/dsm-bm-8-probs.csv', instigator=instigator)
+    dsm_i = parse_csv('./tests/test-assets/dsm-bm-8-imps.csv', instigator=instigator)
+    session = AnalysisSession(dsm_i, dsm_p, max_entries=100)
+
+    queries = [(a, b, depth) for a in range(8) for b in range(8) for depth in [2, 4]]
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        risks = list(executor.map(lambda query: session.risk(*query), queries))
+
+    for (a, b, depth), risk in zip(queries, risks):
+        cpt = ChangePropagationTree(a, b, dsm_i, dsm_p).propagate(search_depth=depth)
+        assert risk == cpt.get_risk()
+        assert session.likelihood(a, b, depth) == cpt.get_probability()
+
+    # 128 pairs do not fit, so the least recently used were evicted
+    assert len(session.cache) == 100
+    assert session.cache.evictions >= 28
+
+    hits = session.cache.hits
+    session.risk(7, 7, 4)
+    assert session.cache.hits == hits + 1
+
+    with pytest.raises(ValueError):
+        session.risk(0, 8)
@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+from cpm.models import DSM
+from cpm.parse import parse_csv
+from cpm.storage import load_risk_matrix, save_risk_matrix
+from cpm.utils import calculate_risk_matrix
+
+
+def test_dsm_round_trip(tmp_path):
+    dsm = parse_csv('./tests/test-assets/dsm-bm-8-probs-transpose.csv', instigator='row')
+    path = str(tmp_path / 'probs.cpm')
+    dsm.save(path)
+
+    loaded = DSM.load(path)
+
+    assert loaded.columns == dsm.columns
+    assert loaded.instigator == 'row'
+    assert np.array_equal(loaded.matrix, dsm.matrix)
+    assert np.array_equal(loaded.indices, dsm.indices)
+    # The matrix is a read-only view of the file
+    assert not loaded.matrix.flags.owndata
+    assert not loaded.matrix.flags.writeable
+
+
+def test_risk_matrix_round_trip(tmp_path):
+    dsm_p = parse_csv('./tests/test-assets/dsm-bm-8-probs.csv')
+    dsm_i = parse_csv('./tests/test-assets/dsm-bm-8-imps.csv')
+    res_mtx = calculate_risk_matrix(dsm_i, dsm_p, search_depth=4)
+
+    path = str(tmp_path / 'risks.cpm')
+    save_risk_matrix(path, res_mtx, dsm_p.columns, metadata={'search_depth': 4})
+    matrix, columns, metadata = load_risk_matrix(path, mmap=False)
+
+    assert matrix.tolist() == res_mtx
+    assert columns == dsm_p.columns
+    assert metadata == {'search_depth': 4}
+
+    with pytest.raises(ValueError):
+        DSM.load(path)
@@ -0,0 +1,45 @@
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pytest
+from cpm.parse import parse_csv
+from cpm.storage import load_matrix, load_risk_matrix
+from cpm.streaming import iter_risk_matrix, risk_matrix_coo, write_risk_csv, write_risk_memmap
+from cpm.utils import calculate_cpm_matrices
+
+
+@pytest.mark.parametrize('instigator', ['column', 'row'])
+def test_streamed_outputs(instigator, tmp_path):
+    dsm_p = parse_csv('./tests/test-assets/dsm-bm-8-probs.csv', instigator=instigator)
+    dsm_i = parse_csv('./tests/test-assets/dsm-bm-8-imps.csv', instigator=instigator)
+    expected = calculate_cpm_matrices(dsm_i, dsm_p, search_depth=4)
+
+    path = str(tmp_path / 'risk.csv')
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        write_risk_csv(path, dsm_i, dsm_p, search_depth=4, executor=executor)
+    written = parse_csv(path)
+    assert written.columns == dsm_p.columns
+    assert np.array_equal(written.matrix, expected.risk)
+
+    path = str(tmp_path / 'likelihood.cpm')
+    write_risk_memmap(path, dsm_i, dsm_p, search_depth=4, dtype=np.float32, likelihood=True)
+    matrix, columns, metadata = load_risk_matrix(path)
+    assert matrix.dtype == np.float32 and metadata['measure'] == 'likelihood'
+    assert np.array_equal(matrix, expected.likelihood.astype(np.float32))
+    assert np.array_equal(load_risk_matrix(path, mmap=False)[0], matrix)
+    # The values from each instigator are stored contiguously
+    assert load_matrix(path)[1].get('order', 'C') == ('F' if instigator == 'column' else 'C')
+
+    rows, columns, values = risk_matrix_coo(dsm_i, dsm_p, search_depth=4, threshold=0.1)
+    kept = np.nonzero(expected.risk > 0.1)
+    assert np.array_equal(rows, kept[0]) and np.array_equal(columns, kept[1])
+    assert np.array_equal(values, expected.risk[kept])
+
+
+def test_iter_risk_matrix():
+    dsm_p = parse_csv('./tests/test-assets/dsm-bm-8-probs.csv')
+    dsm_i = parse_csv('./tests/test-assets/dsm-bm-8-imps.csv')
+    expected = calculate_cpm_matrices(dsm_i, dsm_p, search_depth=3)
+
+    # Column instigators yield the columns of the result
+    for index, risks in iter_risk_matrix(dsm_i, dsm_p, search_depth=3):
+        assert np.array_equal(risks, expected.risk[:, index])